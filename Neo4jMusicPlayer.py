@@ -1,27 +1,90 @@
 # Instalace závislostí:
 # pip install neo4j pygame mutagen
 
+import time
+_PROCESS_START = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import pygame
 import os
-from neo4j import GraphDatabase
 from pathlib import Path
 import hashlib
-from mutagen.easyid3 import EasyID3
-from mutagen.mp3 import MP3
-import time
 from datetime import datetime
 import threading
+import queue
+import bisect
+import heapq
 import io
-from PIL import Image, ImageTk
-from mutagen.id3 import ID3, APIC
+import csv
+import sqlite3
+import json
+import argparse
+import importlib
+import importlib.util
+import sys
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Těžké knihovny (neo4j, pygame, mutagen, PIL, watchdog) se načítají až při
+# prvním použití přes lazy_import, aby se první okno zobrazilo co nejdřív.
+# asyncio potřebuje jen async varianta ve službě, importuje se lokálně v ní.
+
+
+# === 0. ODLOŽENÉ NAČÍTÁNÍ A PROFIL STARTU ===
+class StartupProfiler:
+    """Měření doby importů a inicializace jednotlivých subsystémů (--profile-startup)"""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.enabled:
+                self._report(name, time.perf_counter() - start)
+
+    def mark(self, name):
+        """Zaznamená okamžik (čas od spuštění procesu)"""
+        if self.enabled:
+            self._report(name, None)
+
+    def _report(self, name, duration):
+        since_start = (time.perf_counter() - _PROCESS_START) * 1000
+        thread = threading.current_thread().name
+        with self._lock:
+            if duration is None:
+                print(f"[startup] {name:<32} {'':>10}   t={since_start:8.1f} ms  ({thread})")
+            else:
+                print(f"[startup] {name:<32} {duration * 1000:8.1f} ms   t={since_start:8.1f} ms  ({thread})")
+
+
+startup_profiler = StartupProfiler()
+
+
+def lazy_import(module_name):
+    """Importuje modul až při prvním použití (a změří dobu importu)"""
+    module = sys.modules.get(module_name)
+    if module is None:
+        with startup_profiler.measure(f"import {module_name}"):
+            module = importlib.import_module(module_name)
+    return module
+
+
+def _pil():
+    return lazy_import("PIL.Image"), lazy_import("PIL.ImageTk")
 
 
 # === 1. NEO4J PŘIPOJENÍ ===
 class Neo4jConnection:
-    def __init__(self, uri, user, password):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+    def __init__(self, uri, user, password, **driver_config):
+        GraphDatabase = lazy_import("neo4j").GraphDatabase
+        self.driver = GraphDatabase.driver(uri, auth=(user, password), **driver_config)
 
     def close(self):
         self.driver.close()
@@ -31,10 +94,183 @@ class Neo4jConnection:
             result = session.run(query, parameters)
             return [record.data() for record in result]
 
+    def query_batch(self, queries):
+        """Spustí seznam pojmenovaných dotazů [(name, query, parameters), ...]
+        v jedné session a transakci a vrátí výsledky jako {name: [záznamy]}"""
+        def run_all(tx):
+            results = {}
+            for name, query, parameters in queries:
+                results[name] = [record.data() for record in tx.run(query, parameters)]
+            return results
+
+        with self.driver.session() as session:
+            return session.execute_write(run_all)
+
+    def stream(self, query, parameters=None):
+        """Postupně vrací záznamy bez načtení celého výsledku do seznamu"""
+        with self.driver.session() as session:
+            for record in session.run(query, parameters):
+                yield record.data()
+
     def verify_connection(self):
         self.driver.verify_connectivity()
 
 
+class AsyncNeo4jConnection:
+    """Asynchronní varianta Neo4jConnection nad async driverem"""
+
+    def __init__(self, uri, user, password, **driver_config):
+        AsyncGraphDatabase = lazy_import("neo4j").AsyncGraphDatabase
+        self.driver = AsyncGraphDatabase.driver(uri, auth=(user, password), **driver_config)
+
+    async def close(self):
+        await self.driver.close()
+
+    async def query(self, query, parameters=None):
+        async with self.driver.session() as session:
+            result = await session.run(query, parameters)
+            return [record.data() async for record in result]
+
+    async def verify_connection(self):
+        await self.driver.verify_connectivity()
+
+
+# --- 64bitové identifikátory ---
+ID_HASH_KEY = b"neo4j-music-player/ids/v1"
+
+
+class IdCollisionError(Exception):
+    """Dva různé objekty dostaly stejný 64bitový identifikátor"""
+
+
+def stable_id(kind, value):
+    """64bitové ID (signed, jako Neo4j Integer) z klíčovaného BLAKE2b.
+    kind ("user", "artist", "track") odděluje prostory identifikátorů."""
+    digest = hashlib.blake2b(value.encode(), digest_size=8, key=ID_HASH_KEY, person=kind.encode())
+    return int.from_bytes(digest.digest(), "big", signed=True)
+
+
+def legacy_track_source(legacy_id, content_hash, file_path):
+    """Vstup hashe pro nové ID skladby podle toho, jak vzniklo její staré hex ID: sken
+    podle obsahu ho bral z contentHash, sken podle cesty z MD5 cesty (takový uzel může mít
+    contentHash jen doplněný). Nové ID tak odpovídá tomu, co spočítá sken ve stejném režimu."""
+    if content_hash and legacy_id == content_hash[:12]:
+        return content_hash
+    return file_path
+
+
+def format_id(value):
+    """ID pro text (URL, JSON): 64bitové ID jako právě 16 hex znaků (JavaScript by
+    číslo nad 2^53 zaokrouhlil), staré hex ID (8 nebo 12 znaků) beze změny"""
+    if isinstance(value, int):
+        return f"{value & 0xFFFFFFFFFFFFFFFF:016x}"
+    return value
+
+
+def parse_id(value):
+    """Opak format_id: 16 hex znaků převede na 64bitové ID, cokoli jiného
+    (staré hex ID) nechá jako řetězec"""
+    if isinstance(value, str) and len(value) == 16:
+        try:
+            raw = bytes.fromhex(value)
+        except ValueError:
+            return value
+        if len(raw) == 8:
+            return int.from_bytes(raw, "big", signed=True)
+    return value
+
+
+class IdMigration:
+    """Převod uzlů ze starých hex ID (zkrácené MD5) na 64bitová ID po dávkách.
+
+    Původní hodnota zůstane ve vlastnosti `legacyId` a všechny dotazy hledají podle
+    obou, aplikace tak během převodu funguje dál. Uzel, jehož nové ID už má jiný
+    uzel, se nepřevede a vrátí se jako kolize.
+    """
+
+    # label -> (vlastnost s ID, druh pro stable_id, vlastnosti pro vstup hashe)
+    LABELS = {
+        "User": ("userId", "user", ("name",)),
+        "Artist": ("artistId", "artist", ("name",)),
+        "Track": ("trackId", "track", ("contentHash", "filePath")),
+    }
+
+    def __init__(self, neo4j_conn, batch_size=1000):
+        self.conn = neo4j_conn
+        self.batch_size = batch_size
+
+    def run(self, progress_callback=None):
+        """Převede všechny labely, vrací {label: (převedeno, [kolize])}"""
+        return {label: self.migrate_label(label, progress_callback) for label in self.LABELS}
+
+    def migrate_label(self, label, progress_callback=None):
+        prop, kind, fields = self.LABELS[label]
+        # Nepřevedený uzel má ID jako řetězec. Label se projde jediným streamovaným
+        # čtením a převádí se cestou po dávkách - opakovaný dotaz by každou dávku
+        # hledal znovu od začátku labelu.
+        read_query = f"""
+        MATCH (n:{label})
+        WHERE n.{prop} = toString(n.{prop})
+        RETURN elementId(n) as id, n.{prop} as legacy, {", ".join(f"n.{f} as {f}" for f in fields)}
+        """
+        write_query = f"""
+        UNWIND $rows as row
+        MATCH (n:{label}) WHERE elementId(n) = row.id
+        OPTIONAL MATCH (other:{label} {{{prop}: row.key}})
+        WITH n, row, other
+        WHERE other IS NULL
+        SET n.legacyId = n.{prop}, n.{prop} = row.key
+        {"SET n.lastModified = timestamp()" if label == "Track" else ""}
+        RETURN row.id as id
+        """
+
+        converted = 0
+        collisions = []
+        batch = {}
+        for row in self.conn.stream(read_query):
+            source = self._hash_input(label, row)
+            key = stable_id(kind, source) if source else None
+            if key is None or key in batch:
+                # Bez vstupu pro hash, nebo kolize uvnitř dávky
+                collisions.append(row['legacy'])
+                continue
+            batch[key] = row
+
+            if len(batch) >= self.batch_size:
+                converted += self._convert(write_query, batch, collisions)
+                if progress_callback:
+                    progress_callback(label, converted, len(collisions))
+
+        if batch:
+            converted += self._convert(write_query, batch, collisions)
+            if progress_callback:
+                progress_callback(label, converted, len(collisions))
+        return converted, collisions
+
+    def _convert(self, write_query, batch, collisions):
+        """Zapíše dávku {nové ID: řádek}, nepřevedené uzly přidá do kolizí a dávku vyprázdní"""
+        rows = [{"id": row['id'], "key": key} for key, row in batch.items()]
+        try:
+            done = {r['id'] for r in self.conn.query(write_query, {"rows": rows})}
+        except lazy_import("neo4j").exceptions.ConstraintError:
+            # Stejné ID mezitím zapsal souběžný sken - dávka po jednom, neprošlé jsou kolize
+            done = set()
+            for row in rows:
+                try:
+                    done.update(r['id'] for r in self.conn.query(write_query, {"rows": [row]}))
+                except lazy_import("neo4j").exceptions.ConstraintError:
+                    pass
+        collisions.extend(row['legacy'] for row in batch.values() if row['id'] not in done)
+        batch.clear()
+        return len(done)
+
+    @staticmethod
+    def _hash_input(label, row):
+        if label == "Track":
+            return legacy_track_source(row['legacy'], row['contentHash'], row['filePath'])
+        return row['name']
+
+
 # === 2. SPRÁVA UŽIVATELŮ ===
 class UserManager:
     def __init__(self, neo4j_conn):
@@ -42,22 +278,27 @@ class UserManager:
 
     def register_user(self, username):
         """Registrace nového uživatele"""
-        check_query = """
-        MATCH (u:User {name: $username})
-        RETURN u.userId as userId
-        """
-        result = self.conn.query(check_query, {"username": username})
+        user_id = stable_id("user", username)
 
-        if result:
+        # Kontrola existence (jména i ID) a vytvoření v jednom dotazu
+        query = """
+        OPTIONAL MATCH (existing:User {name: $username})
+        OPTIONAL MATCH (clash:User {userId: $userId})
+        WITH existing IS NOT NULL as name_taken, clash IS NOT NULL as id_clash
+        FOREACH (_ IN CASE WHEN name_taken OR id_clash THEN [] ELSE [1] END |
+            CREATE (:User {name: $username, userId: $userId}))
+        RETURN name_taken, id_clash
+        """
+        try:
+            result = self.conn.query(query, {"username": username, "userId": user_id})[0]
+        except lazy_import("neo4j").exceptions.ConstraintError:
+            # Souběžná registrace stejného jména - stejné userId zastavilo omezení unikátnosti
             return None, "Uživatelské jméno již existuje"
 
-        user_id = hashlib.md5(username.encode()).hexdigest()[:8]
-
-        create_query = """
-        CREATE (u:User {name: $username, userId: $userId})
-        RETURN u.userId as userId
-        """
-        self.conn.query(create_query, {"username": username, "userId": user_id})
+        if result['name_taken']:
+            return None, "Uživatelské jméno již existuje"
+        if result['id_clash']:
+            return None, "Kolize identifikátoru, zvolte prosím jiné jméno"
 
         return user_id, "Registrace úspěšná"
 
@@ -76,93 +317,1618 @@ class UserManager:
 
 
 # === 3. NAČÍTÁNÍ MP3 SOUBORŮ ===
-class MusicLibraryScanner:
-    def __init__(self, neo4j_conn):
-        self.conn = neo4j_conn
+THUMBNAIL_SIZE = (150, 150)
+ARTWORK_DIR = Path.home() / ".neo4j_music_player" / "artwork"
 
-    def scan_directory(self, directory_path, progress_callback=None):
-        """Naskenuje složku a vytvoří uzly v Neo4j"""
-        mp3_files = list(Path(directory_path).rglob("*.mp3"))
 
-        if not mp3_files:
-            return 0
+class ArtworkStore:
+    """Úložiště předrenderovaných náhledů obalů alb (klíčem je hash obalu)"""
+
+    def __init__(self, directory=ARTWORK_DIR):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, art_hash):
+        return self.directory / f"{art_hash}.png"
+
+    def contains(self, art_hash):
+        return self.path_for(art_hash).exists()
+
+    def save(self, art_hash, image_data):
+        """Zmenší obal na velikost náhledu a uloží ho jako PNG"""
+        Image = lazy_import("PIL.Image")
+        image = Image.open(io.BytesIO(image_data)).convert('RGB')
+        image = image.resize(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+        image.save(self.path_for(art_hash), format='PNG')
 
-        for i, file_path in enumerate(mp3_files):
+    def load(self, art_hash):
+        """Vrátí náhled jako PIL obrázek, nebo None"""
+        if not art_hash:
+            return None
+        try:
+            return lazy_import("PIL.Image").open(self.path_for(art_hash))
+        except OSError:
+            return None
+
+
+class MediaProbe:
+    """Jediné čtení MP3 souboru: tagy, délka a obal alba najednou"""
+
+    # Ukládá se na uzel Track (probeVersion) - uzly ze starších verzí se doplní při skenování
+    VERSION = 1
+
+    def __init__(self, artwork_store):
+        self.artwork_store = artwork_store
+
+    def probe(self, file_path):
+        """Vrátí slovník s metadaty skladby a hashem obalu"""
+        audio = lazy_import("mutagen.mp3").MP3(file_path)
+        tags = audio.tags
+
+        info = {
+            "title": self._text(tags, 'TIT2') or Path(file_path).stem,
+            "artist": self._text(tags, 'TPE1') or "Unknown Artist",
+            "genre": self._genre(tags) or "Unknown",
+            "duration": int(audio.info.length),
+            "art_hash": None,
+        }
+
+        image_data = self._artwork(tags)
+        if image_data:
+            art_hash = hashlib.sha1(image_data).hexdigest()[:16]
             try:
-                self._process_mp3_file(str(file_path))
-                if progress_callback:
-                    progress_callback(i + 1, len(mp3_files))
+                # Stejný obal sdílí celé album -> renderujeme jen jednou
+                if not self.artwork_store.contains(art_hash):
+                    self.artwork_store.save(art_hash, image_data)
+                info["art_hash"] = art_hash
             except Exception as e:
-                print(f"Chyba při zpracování {file_path.name}: {e}")
+                print(f"Nelze uložit obal {Path(file_path).name}: {e}")
+
+        return info
+
+    @staticmethod
+    def _text(tags, frame_id):
+        if not tags:
+            return None
+        frame = tags.get(frame_id)
+        if frame and frame.text:
+            return str(frame.text[0])
+        return None
+
+    @staticmethod
+    def _genre(tags):
+        if not tags:
+            return None
+        frame = tags.get('TCON')
+        if frame and frame.genres:
+            return frame.genres[0]
+        return None
+
+    @staticmethod
+    def _artwork(tags):
+        if not tags:
+            return None
+        for tag in tags.values():
+            if tag.FrameID == 'APIC':  # APIC je ID3 tag pro obrázek
+                return tag.data
+        return None
+
+
+def audio_content_hash(file_path, chunk_size=1 << 20):
+    """MD5 zvukových dat bez ID3 tagů, vrací (hash, velikost dat)"""
+    with open(file_path, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        f.seek(0)
+
+        # ID3v2 na začátku souboru (velikost je v "syncsafe" formátu)
+        start = 0
+        header = f.read(10)
+        if len(header) == 10 and header[:3] == b'ID3':
+            size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+            start = 10 + size + (10 if header[5] & 0x10 else 0)
+
+        # ID3v1 na konci souboru (posledních 128 bajtů)
+        if end - start >= 128:
+            f.seek(end - 128)
+            if f.read(3) == b'TAG':
+                end -= 128
+
+        start = min(start, end)
+        digest = hashlib.md5()
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+
+    return digest.hexdigest(), end - start
+
+
+class ScanProgress:
+    """Průběh skenování jako proud událostí ve frontě.
+
+    Skenovací vlákno volá start/file_done/file_failed/finish, spotřebitel (Tk smyčka,
+    Jupyter, konzole) si události vybírá ve svém vlákně a vlastním tempem. Každá událost
+    je úplný stav, takže spotřebiteli stačí poslední z nich."""
+
+    def __init__(self, min_interval=0.25):
+        self.events = queue.Queue()
+        self.min_interval = min_interval  # nejkratší odstup dvou událostí v sekundách
+        self.found = 0
+        self.total = 0
+        self.total_bytes = 0
+        self.done = 0
+        self.bytes_done = 0
+        self.errors = 0
+        self.last_error = None
+        self.failed = False
+        self._started = None
+        self._last_publish = 0.0
+
+    def start(self, found, sizes):
+        """found = všechny nalezené soubory, sizes = velikosti souborů ke zpracování"""
+        self.found = found
+        self.total = len(sizes)
+        self.total_bytes = sum(sizes)
+        self._started = time.monotonic()
+        self._publish(force=True)
+
+    def file_done(self, size):
+        self.done += 1
+        self.bytes_done += size
+        self._publish()
+
+    def file_failed(self, file_path, error, size=0):
+        self.done += 1
+        self.bytes_done += size
+        self.errors += 1
+        self.last_error = f"{Path(file_path).name}: {error}"
+        self._publish()
+
+    def finish(self, error=None):
+        if error:
+            self.failed = True
+            self.last_error = str(error)
+        self._publish(force=True, finished=True)
+
+    def snapshot(self, finished=False):
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        files_per_second = self.done / elapsed if elapsed > 0 else 0.0
+        bytes_per_second = self.bytes_done / elapsed if elapsed > 0 else 0.0
+
+        # ETA podle objemu dat, u souborů bez velikosti podle počtu
+        eta = None
+        if bytes_per_second > 0 and self.total_bytes:
+            eta = (self.total_bytes - self.bytes_done) / bytes_per_second
+        elif files_per_second > 0:
+            eta = (self.total - self.done) / files_per_second
+
+        return {
+            "found": self.found,
+            "done": self.done,
+            "total": self.total,
+            "pending": self.total - self.done,
+            "bytes_done": self.bytes_done,
+            "total_bytes": self.total_bytes,
+            "files_per_second": files_per_second,
+            "bytes_per_second": bytes_per_second,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "elapsed": elapsed,
+            "eta": 0.0 if finished else eta,
+            "finished": finished,
+            "failed": self.failed,
+        }
+
+    def _publish(self, force=False, finished=False):
+        now = time.monotonic()
+        if not force and now - self._last_publish < self.min_interval:
+            return
+        self._last_publish = now
+        self.events.put(self.snapshot(finished))
+
+    # --- Spotřebitel ---
+    def drain(self):
+        """Neblokující: vybere frontu a vrátí poslední událost (nebo None)"""
+        event = None
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                return event
+
+    def iter_events(self, timeout=None):
+        """Blokující generátor událostí až po závěrečnou (Jupyter, konzole)"""
+        while True:
+            event = self.events.get(timeout=timeout)
+            yield event
+            if event["finished"]:
+                return
+
+    @staticmethod
+    def format(event):
+        eta = event["eta"]
+        eta_text = f"{int(eta // 60)}:{int(eta % 60):02d}" if eta is not None else "?"
+        return (f"{event['done']} / {event['total']}  |  "
+                f"{event['files_per_second']:.1f} souborů/s, "
+                f"{event['bytes_per_second'] / (1 << 20):.1f} MB/s  |  "
+                f"zbývá {event['pending']} (ETA {eta_text})  |  chyb: {event['errors']}")
+
+
+class MusicLibraryScanner:
+    IDENTITY_PATH = "path"        # trackId z cesty k souboru (původní chování)
+    IDENTITY_CONTENT = "content"  # trackId z obsahu, přesuny se jen přepíšou
+    WRITE_BATCH_SIZE = 1000
+
+    def __init__(self, neo4j_conn, artwork_store=None, identity_mode=IDENTITY_PATH):
+        self.conn = neo4j_conn
+        self.probe = MediaProbe(artwork_store or ArtworkStore())
+        self.identity_mode = identity_mode
+        self._content_hashes = {}
+
+    def scan_directory(self, directory_path, progress=None):
+        """Naskenuje složku a vytvoří uzly v Neo4j, průběh publikuje do ScanProgress"""
+        progress = progress or ScanProgress()
+        try:
+            mp3_files = list(Path(directory_path).rglob("*.mp3"))
 
+            pending, backfill = mp3_files, []
+            if mp3_files and self.identity_mode == self.IDENTITY_CONTENT:
+                pending, backfill = self._apply_moves(directory_path, mp3_files)
+
+            sizes = [self._file_size(file_path) for file_path in pending]
+            backfill_sizes = [self._file_size(Path(path)) for path in backfill]
+            progress.start(len(mp3_files), sizes + backfill_sizes)
+
+            for file_path, size in zip(pending, sizes):
+                try:
+                    self._process_mp3_file(str(file_path))
+                    progress.file_done(size)
+                except Exception as e:
+                    print(f"Chyba při zpracování {file_path.name}: {e}")
+                    progress.file_failed(file_path, e, size)
+
+            self._backfill(backfill, backfill_sizes, progress)
+        except Exception as e:
+            progress.finish(error=e)
+            raise
+        finally:
+            self._content_hashes.clear()
+
+        progress.finish()
         return len(mp3_files)
 
-    def _process_mp3_file(self, file_path):
-        """Zpracuje jeden MP3 soubor a vytvoří uzly"""
+    @staticmethod
+    def _file_size(file_path):
         try:
-            audio = MP3(file_path, ID3=EasyID3)
-            duration = int(audio.info.length)
-            title = audio.get('title', [Path(file_path).stem])[0]
-            artist_name = audio.get('artist', ['Unknown Artist'])[0]
-            genre_name = audio.get('genre', ['Unknown'])[0]
-        except:
-            audio = MP3(file_path)
-            duration = int(audio.info.length)
-            title = Path(file_path).stem
-            artist_name = "Unknown Artist"
-            genre_name = "Unknown"
-
-        track_id = hashlib.md5(file_path.encode()).hexdigest()[:12]
-        artist_id = hashlib.md5(artist_name.encode()).hexdigest()[:8]
+            return file_path.stat().st_size
+        except OSError:
+            return 0
 
+    def _apply_moves(self, directory_path, mp3_files):
+        """Rozpozná přesunuté/přejmenované soubory a vrátí (nové soubory ke zpracování,
+        cesty známých uzlů, které je nutné doplnit)"""
         query = """
-        MERGE (a:Artist {artistId: $artist_id})
-        ON CREATE SET a.name = $artist_name
+        MATCH (t:Track)
+        WHERE t.filePath STARTS WITH $root
+        RETURN t.trackId as trackId, t.filePath as filePath,
+               t.contentHash as contentHash, t.fileSize as fileSize,
+               t.probeVersion as probeVersion
+        """
+        # Oddělovač na konci, aby sken /music nezahrnul uzly z /music2
+        known = self.conn.query(query, {"root": os.path.join(str(Path(directory_path)), "")})
+        known_paths = {row['filePath'] for row in known}
+        on_disk = {str(file_path) for file_path in mp3_files}
+
+        # Uzly, jejichž soubor už na původní cestě není
+        missing = {}
+        backfill = []
+        for row in known:
+            if row['filePath'] not in on_disk:
+                if row['contentHash']:
+                    missing[(row['contentHash'], row['fileSize'])] = row['trackId']
+            elif not row['contentHash'] or (row['probeVersion'] or 0) < MediaProbe.VERSION:
+                # Uzel ze skenování podle cesty nebo ze starší verze - bez hashe obsahu
+                # by jeho pozdější přesun nešel rozpoznat
+                backfill.append(row['filePath'])
+
+        pending = []
+        moves = []
+        for file_path in mp3_files:
+            path_str = str(file_path)
+            if path_str in known_paths:
+                continue
+
+            if missing:
+                try:
+                    content_key = audio_content_hash(path_str)
+                except OSError as e:
+                    print(f"Chyba při zpracování {file_path.name}: {e}")
+                    continue
+
+                track_id = missing.pop(content_key, None)
+                if track_id:
+                    moves.append({"track_id": track_id, "file_path": path_str})
+                    continue
+                self._content_hashes[path_str] = content_key
+
+            pending.append(file_path)
+
+        move_query = """
+        UNWIND $moves as m
+        MATCH (t:Track {trackId: m.track_id})
+        SET t.filePath = m.file_path, t.lastModified = timestamp()
+        """
+        self._write_batched(move_query, "moves", moves)
+
+        return pending, backfill
 
-        MERGE (g:Genre {name: $genre_name})
+    def _backfill(self, paths, sizes, progress):
+        """Doplní známé uzly ze starších verzí (hash obsahu, obal alba) - známé cesty se
+        v režimu podle obsahu jinak znovu nečtou. Zápis po dávkách, trackId se nemění."""
+        query = """
+        UNWIND $rows as row
+        MATCH (t:Track {filePath: row.file_path})
+        SET t.artHash = row.art_hash,
+            t.probeVersion = row.probe_version,
+            t.contentHash = row.content_hash,
+            t.fileSize = row.file_size,
+            t.lastModified = timestamp()
+        """
+        rows = []
+        for path, size in zip(paths, sizes):
+            try:
+                info = self.probe.probe(path)
+                content_hash, file_size = audio_content_hash(path)
+                rows.append({"file_path": path, "art_hash": info["art_hash"],
+                             "probe_version": MediaProbe.VERSION,
+                             "content_hash": content_hash, "file_size": file_size})
+                progress.file_done(size)
+            except Exception as e:
+                print(f"Chyba při zpracování {Path(path).name}: {e}")
+                progress.file_failed(path, e, size)
+            if len(rows) >= self.WRITE_BATCH_SIZE:
+                self._write_batched(query, "rows", rows)
+                rows = []
+        self._write_batched(query, "rows", rows)
+
+    def _write_batched(self, query, key, items):
+        """Spustí UNWIND dotaz po dávkách o velikosti WRITE_BATCH_SIZE"""
+        for i in range(0, len(items), self.WRITE_BATCH_SIZE):
+            self.conn.query(query, {key: items[i:i + self.WRITE_BATCH_SIZE]})
+
+    def ensure_indexes(self):
+        """Indexy na cestě k souboru (synchronizace) a názvu skladby (stránkování)"""
+        self.conn.query("CREATE INDEX track_file_path IF NOT EXISTS FOR (t:Track) ON (t.filePath)")
+        self.conn.query("CREATE INDEX track_title IF NOT EXISTS FOR (t:Track) ON (t.title)")
+        self.conn.query("CREATE INDEX track_last_modified IF NOT EXISTS FOR (t:Track) ON (t.lastModified)")
+
+    def apply_changes(self, changes, max_files_per_second=None):
+        """Promítne změny ze sledování složky do Neo4j bez úplného skenování"""
+        created = list(changes.created)
+        updated = list(changes.updated)
+        deleted = list(changes.deleted)
+        moved = dict(changes.moved)
+
+        if self.identity_mode == self.IDENTITY_PATH:
+            # trackId je odvozen z cesty -> přesun je smazání + nové vložení
+            deleted.extend(moved.keys())
+            created.extend(moved.values())
+            updated = [path for path in updated if path not in moved.values()]
+            moved = {}
+        elif deleted and created:
+            # Polling hlásí přesun jako smazání + vytvoření, spárujeme podle obsahu
+            query = """
+            MATCH (t:Track)
+            WHERE t.filePath IN $paths AND t.contentHash IS NOT NULL
+            RETURN t.filePath as filePath, t.contentHash as contentHash, t.fileSize as fileSize
+            """
+            rows = self.conn.query(query, {"paths": deleted})
+            by_content = {(row['contentHash'], row['fileSize']): row['filePath'] for row in rows}
+            for path in list(created):
+                try:
+                    content_key = audio_content_hash(path)
+                except OSError:
+                    continue
+                src = by_content.pop(content_key, None)
+                if src:
+                    moved[src] = path
+                    created.remove(path)
+                    deleted.remove(src)
+                else:
+                    self._content_hashes[path] = content_key
+
+        move_query = """
+        UNWIND $moves as m
+        MATCH (t:Track {filePath: m.src})
+        SET t.filePath = m.dst, t.lastModified = timestamp()
+        """
+        self._write_batched(move_query, "moves",
+                            [{"src": src, "dst": dst} for src, dst in moved.items()])
+
+        delete_query = """
+        UNWIND $paths as path
+        MATCH (t:Track {filePath: path})
+        CALL {
+            // Smazané poslechy se odečtou z afinit umělců
+            WITH t
+            MATCH (t)-[:IS_PERFORMED_BY]->(other:Artist)
+            MATCH (t)<-[:LISTENED_TO]-(:User)-[:IS_A_FAN_OF]->(a:Artist)
+            WHERE a <> other
+            WITH a, other, count(*) as delta
+            MATCH (a)-[r:AFFINE_TO]->(other)
+            SET r.strength = r.strength - delta
+        }
+        DETACH DELETE t
+        """
+        self._write_batched(delete_query, "paths", deleted)
+
+        # U změněných souborů se vazby na umělce a žánr vytvoří znovu
+        clear_query = """
+        UNWIND $paths as path
+        MATCH (t:Track {filePath: path})
+        CALL {
+            // Poslechy se odečtou z afinit původního umělce, nový je přičte při zpracování
+            WITH t
+            MATCH (t)-[:IS_PERFORMED_BY]->(other:Artist)
+            MATCH (t)<-[:LISTENED_TO]-(:User)-[:IS_A_FAN_OF]->(a:Artist)
+            WHERE a <> other
+            WITH a, other, count(*) as delta
+            MATCH (a)-[r:AFFINE_TO]->(other)
+            SET r.strength = r.strength - delta
+        }
+        MATCH (t)-[rel:IS_PERFORMED_BY|BELONGS_TO]->()
+        DELETE rel
+        """
+        self._write_batched(clear_query, "paths", updated)
 
-        MERGE (t:Track {trackId: $track_id})
-        ON CREATE SET 
-            t.title = $title,
-            t.duration = $duration,
-            t.filePath = $file_path
+        # Omezení rychlosti, aby velké kopírování nebrzdilo přehrávání
+        delay = 1.0 / max_files_per_second if max_files_per_second else 0
+        ingested = []
+        for path in created + updated:
+            try:
+                self._process_mp3_file(path, refresh=True)
+                ingested.append(path)
+            except Exception as e:
+                print(f"Chyba při zpracování {Path(path).name}: {e}")
+            if delay:
+                time.sleep(delay)
+        self._content_hashes.clear()
+
+        return {
+            "deleted": deleted + updated,
+            "moved": moved,
+            "tracks": self.get_tracks_by_paths(ingested) if ingested else [],
+        }
+
+    def _process_mp3_file(self, file_path, refresh=False):
+        """Zpracuje jeden MP3 soubor a vytvoří uzly"""
+        info = self.probe.probe(file_path)
+        duration = info["duration"]
+        title = info["title"]
+        artist_name = info["artist"]
+        genre_name = info["genre"]
+
+        track_id, content_hash, file_size = self._track_identity(file_path)
+        legacy_track_id = self._legacy_track_id(file_path, content_hash)
+        if refresh:
+            # Změněný soubor aktualizuje uzel na své cestě, i když by z nového obsahu
+            # (nebo z cesty u uzlu ze skenování podle cesty) vyšlo jiné ID - jinak by
+            # vznikl druhý uzel a poslechy by zůstaly na starém bez umělce
+            known_id = self._track_id_at(file_path)
+            if isinstance(known_id, str):
+                legacy_track_id = known_id  # ještě nepřevedený uzel se převede na místě
+            elif known_id is not None:
+                track_id = known_id
+        artist_id = self._artist_id(artist_name)
 
-        MERGE (t)-[:IS_PERFORMED_BY]->(a)
-        MERGE (t)-[:BELONGS_TO]->(g)
+        query = """
+        // Uzly se starým hex ID se převedou hned, aby vedle nich nevznikly duplikáty
+        OPTIONAL MATCH (old_artist:Artist {artistId: $legacy_artist_id})
+        WHERE old_artist.name = $artist_name
+        OPTIONAL MATCH (old_track:Track {trackId: $legacy_track_id})
+        FOREACH (_ IN CASE WHEN old_artist IS NULL THEN [] ELSE [1] END |
+            SET old_artist.legacyId = old_artist.artistId, old_artist.artistId = $artist_id)
+        FOREACH (_ IN CASE WHEN old_track IS NULL THEN [] ELSE [1] END |
+            SET old_track.legacyId = old_track.trackId, old_track.trackId = $track_id)
+        WITH count(*) as _
+
+        // Kolize: stejné 64bitové ID má jiný umělec / jiný soubor (v režimu podle cesty)
+        OPTIONAL MATCH (artist_clash:Artist {artistId: $artist_id})
+        WHERE artist_clash.name <> $artist_name
+        OPTIONAL MATCH (track_clash:Track {trackId: $track_id})
+        WHERE $content_hash IS NULL AND track_clash.filePath <> $file_path
+        WITH artist_clash IS NOT NULL as artist_clash, track_clash IS NOT NULL as track_clash
+
+        CALL {
+            WITH artist_clash, track_clash
+            WITH * WHERE NOT artist_clash AND NOT track_clash
+
+            MERGE (a:Artist {artistId: $artist_id})
+            ON CREATE SET a.name = $artist_name
+
+            MERGE (g:Genre {name: $genre_name})
+
+            MERGE (t:Track {trackId: $track_id})
+            ON CREATE SET 
+                t.title = $title,
+                t.duration = $duration,
+                t.filePath = $file_path
+            ON MATCH SET
+                t.title = CASE WHEN $refresh THEN $title ELSE t.title END,
+                t.duration = CASE WHEN $refresh THEN $duration ELSE t.duration END,
+                t.filePath = CASE WHEN $refresh THEN $file_path ELSE t.filePath END
+            SET t.lastModified = timestamp(),
+                t.artHash = $art_hash,
+                t.probeVersion = $probe_version,
+                t.contentHash = coalesce($content_hash, t.contentHash),
+                t.fileSize = coalesce($file_size, t.fileSize)
+
+            MERGE (t)-[:BELONGS_TO]->(g)
+
+            // Nový interpret už poslouchané skladby (změna tagu): poslechy jejích
+            // posluchačů se přičtou k afinitám umělců, jejichž jsou fanoušky
+            WITH t, a, EXISTS { (t)-[:IS_PERFORMED_BY]->(a) } as known_artist
+            MERGE (t)-[:IS_PERFORMED_BY]->(a)
+            WITH t, a
+            WHERE NOT known_artist
+            MATCH (t)<-[:LISTENED_TO]-(:User)-[:IS_A_FAN_OF]->(fav:Artist)
+            WHERE fav <> a
+            WITH a, fav, count(*) as delta
+            MERGE (fav)-[r:AFFINE_TO]->(a)
+            ON CREATE SET r.strength = delta
+            ON MATCH SET r.strength = r.strength + delta
+        }
+        RETURN artist_clash, track_clash
         """
 
-        self.conn.query(query, {
+        result = self.conn.query(query, {
+            "legacy_artist_id": self._legacy_artist_id(artist_name),
+            "legacy_track_id": legacy_track_id,
             "track_id": track_id,
             "title": title,
             "duration": duration,
             "file_path": file_path,
+            "art_hash": info["art_hash"],
+            "probe_version": MediaProbe.VERSION,
+            "content_hash": content_hash,
+            "file_size": file_size,
+            "refresh": refresh,
             "artist_id": artist_id,
             "artist_name": artist_name,
             "genre_name": genre_name
-        })
+        })[0]
+
+        if result['artist_clash']:
+            raise IdCollisionError(f"Umělec '{artist_name}' má stejné ID jako jiný umělec")
+        if result['track_clash']:
+            raise IdCollisionError("Skladba má stejné ID jako jiný soubor")
+
+    def _track_id_at(self, file_path):
+        """trackId uzlu uloženého pod danou cestou, nebo None"""
+        query = """
+        MATCH (t:Track {filePath: $file_path})
+        RETURN t.trackId as trackId
+        LIMIT 1
+        """
+        rows = self.conn.query(query, {"file_path": file_path})
+        return rows[0]['trackId'] if rows else None
+
+    def _track_identity(self, file_path):
+        """Vrátí (trackId, contentHash, fileSize) podle zvoleného režimu identity"""
+        if self.identity_mode == self.IDENTITY_CONTENT:
+            content_hash, file_size = (self._content_hashes.pop(file_path, None)
+                                       or audio_content_hash(file_path))
+            return stable_id("track", content_hash), content_hash, file_size
+        return stable_id("track", file_path), None, None
+
+    @staticmethod
+    def _artist_id(artist_name):
+        return stable_id("artist", artist_name)
+
+    # Původní hex ID (kvůli převodu uzlů, které ještě neprošly IdMigration)
+    @staticmethod
+    def _legacy_track_id(file_path, content_hash):
+        if content_hash:
+            return content_hash[:12]
+        return hashlib.md5(file_path.encode()).hexdigest()[:12]
+
+    @staticmethod
+    def _legacy_artist_id(artist_name):
+        return hashlib.md5(artist_name.encode()).hexdigest()[:8]
+
+    # --- Offline import pro první načtení velkých knihoven ---
+    BULK_FILES = {
+        # ID pro vazby je ve zvláštním sloupci, vlastnost trackId/artistId je číslo
+        "tracks": [":ID(Track)", "trackId:long", "title", "duration:int", "filePath",
+                   "artHash", "probeVersion:int", "contentHash", "fileSize:long"],
+        "artists": [":ID(Artist)", "artistId:long", "name"],
+        "genres": ["name:ID(Genre)"],
+        "performed_by": [":START_ID(Track)", ":END_ID(Artist)"],
+        "belongs_to": [":START_ID(Track)", ":END_ID(Genre)"],
+    }
+
+    def export_bulk_import(self, directory_path, output_dir, chunk_size=10000):
+        """Zapíše CSV soubory pro `neo4j-admin database import` místo zápisu přes MERGE.
+        Vrací manifest s počty zapsaných uzlů a vazeb."""
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        # Hlavičky zvlášť, data se streamují po dávkách
+        for name, header in self.BULK_FILES.items():
+            with open(output_dir / f"{name}_header.csv", "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow(header)
+
+        files = {name: open(output_dir / f"{name}.csv", "w", newline="", encoding="utf-8")
+                 for name in self.BULK_FILES}
+        writers = {name: csv.writer(f) for name, f in files.items()}
+        buffers = {name: [] for name in self.BULK_FILES}
+
+        def flush(force=False):
+            for name, rows in buffers.items():
+                if rows and (force or len(rows) >= chunk_size):
+                    writers[name].writerows(rows)
+                    rows.clear()
+
+        # Umělci, žánry a skladby se deduplikují v paměti
+        artists = {}
+        genres = set()
+        track_ids = set()
+        errors = 0
+
+        try:
+            mp3_files = Path(directory_path).rglob("*.mp3")
+            for file_path in mp3_files:
+                path_str = str(file_path)
+                try:
+                    info = self.probe.probe(path_str)
+                    track_id, content_hash, file_size = self._track_identity(path_str)
+                except Exception as e:
+                    errors += 1
+                    print(f"Chyba při zpracování {file_path.name}: {e}")
+                    continue
+
+                if track_id in track_ids:
+                    if content_hash is None:
+                        # Různé cesty se stejným ID - kolize
+                        errors += 1
+                        print(f"Kolize ID skladby: {path_str}")
+                    continue
+
+                artist_id = self._artist_id(info["artist"])
+                known_artist = artists.get(artist_id)
+                if known_artist is None:
+                    artists[artist_id] = info["artist"]
+                    buffers["artists"].append([artist_id, artist_id, info["artist"]])
+                elif known_artist != info["artist"]:
+                    errors += 1
+                    print(f"Kolize ID umělce: '{info['artist']}' a '{known_artist}'")
+                    continue
+                track_ids.add(track_id)
+                if info["genre"] not in genres:
+                    genres.add(info["genre"])
+                    buffers["genres"].append([info["genre"]])
+
+                buffers["tracks"].append([track_id, track_id, info["title"], info["duration"], path_str,
+                                          info["art_hash"] or "", MediaProbe.VERSION,
+                                          content_hash or "", file_size or ""])
+                buffers["performed_by"].append([track_id, artist_id])
+                buffers["belongs_to"].append([track_id, info["genre"]])
+                flush()
+            flush(force=True)
+        finally:
+            for f in files.values():
+                f.close()
+
+        manifest = {
+            "counts": {
+                "Track": len(track_ids),
+                "Artist": len(artists),
+                "Genre": len(genres),
+                "IS_PERFORMED_BY": len(track_ids),
+                "BELONGS_TO": len(track_ids),
+            },
+            "errors": errors,
+        }
+        with open(output_dir / "manifest.json", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+    @staticmethod
+    def bulk_import_command(output_dir, database="neo4j"):
+        """Příkaz pro neo4j-admin nad soubory z export_bulk_import (databáze musí být zastavená).
+        Import PŘEPÍŠE celou cílovou databázi včetně uživatelů, poslechů a fanoušků -
+        je určen jen pro první načtení do prázdné databáze."""
+        output_dir = Path(output_dir).resolve()
+
+        def files(name):
+            return f"{output_dir / (name + '_header.csv')},{output_dir / (name + '.csv')}"
+
+        # Názvy a cesty se zapisují tak, jak jsou, a mohou obsahovat konec řádku
+        return (
+            "neo4j-admin database import full --overwrite-destination --multiline-fields=true"
+            f' --nodes=Track="{files("tracks")}"'
+            f' --nodes=Artist="{files("artists")}"'
+            f' --nodes=Genre="{files("genres")}"'
+            f' --relationships=IS_PERFORMED_BY="{files("performed_by")}"'
+            f' --relationships=BELONGS_TO="{files("belongs_to")}"'
+            f" {database}"
+        )
+
+    def verify_bulk_import(self, output_dir):
+        """Porovná počty uzlů a vazeb v databázi s manifestem exportu.
+        Vrací {název: (očekáváno, v databázi)} pro všechny položky."""
+        with open(Path(output_dir) / "manifest.json", encoding="utf-8") as f:
+            expected = json.load(f)["counts"]
+
+        query = """
+        RETURN COUNT { (:Track) } as Track,
+               COUNT { (:Artist) } as Artist,
+               COUNT { (:Genre) } as Genre,
+               COUNT { ()-[:IS_PERFORMED_BY]->() } as IS_PERFORMED_BY,
+               COUNT { ()-[:BELONGS_TO]->() } as BELONGS_TO
+        """
+        actual = self.conn.query(query)[0]
+        return {name: (count, actual[name]) for name, count in expected.items()}
 
     def get_all_tracks(self):
         """Vrátí všechny skladby z databáze"""
+        return self.conn.query(self._all_tracks_query())
+
+    def load_catalogue(self):
+        """Načte všechny skladby rovnou do kompaktního katalogu (bez mezilehlého seznamu)"""
+        return TrackCatalogue(self.conn.stream(self._all_tracks_query()))
+
+    @staticmethod
+    def _all_tracks_query():
         query = """
         MATCH (t:Track)-[:IS_PERFORMED_BY]->(a:Artist)
         OPTIONAL MATCH (t)-[:BELONGS_TO]->(g:Genre)
         RETURN t.trackId as trackId, t.title as title, t.duration as duration,
                t.filePath as filePath, a.name as artist, a.artistId as artistId,
-               g.name as genre
+               g.name as genre, t.artHash as artHash
+        ORDER BY t.title
+        """
+        return query
+
+    def get_tracks_page(self, offset, limit):
+        """Vrátí jednu stránku skladeb seřazených podle názvu"""
+        query = """
+        MATCH (t:Track)
+        WHERE t.title IS NOT NULL
+        WITH t
         ORDER BY t.title
+        SKIP $offset
+        LIMIT $limit
+        MATCH (t)-[:IS_PERFORMED_BY]->(a:Artist)
+        OPTIONAL MATCH (t)-[:BELONGS_TO]->(g:Genre)
+        RETURN t.trackId as trackId, t.title as title, t.duration as duration,
+               t.filePath as filePath, a.name as artist, a.artistId as artistId,
+               g.name as genre, t.artHash as artHash
+        """
+        return self.conn.query(query, {"offset": offset, "limit": limit})
+
+    def get_tracks_by_paths(self, paths):
+        """Vrátí skladby pro zadané cesty (stejný tvar jako get_all_tracks)"""
+        query = """
+        MATCH (t:Track)-[:IS_PERFORMED_BY]->(a:Artist)
+        WHERE t.filePath IN $paths
+        OPTIONAL MATCH (t)-[:BELONGS_TO]->(g:Genre)
+        RETURN t.trackId as trackId, t.title as title, t.duration as duration,
+               t.filePath as filePath, a.name as artist, a.artistId as artistId,
+               g.name as genre, t.artHash as artHash
+        """
+        return self.conn.query(query, {"paths": paths})
+
+
+class LibraryChangeSet:
+    """Sloučené změny souborů mezi dvěma zápisy do databáze"""
+
+    def __init__(self):
+        self.created = set()
+        self.updated = set()
+        self.deleted = set()
+        self.moved = {}  # původní cesta -> nová cesta
+
+    def __bool__(self):
+        return bool(self.created or self.updated or self.deleted or self.moved)
+
+    def _moved_source(self, path):
+        for src, dst in self.moved.items():
+            if dst == path:
+                return src
+        return None
+
+    def add(self, kind, path, dest=None):
+        if kind == "created":
+            if path in self.deleted:
+                self.deleted.discard(path)
+                self.updated.add(path)
+            else:
+                self.created.add(path)
+        elif kind == "modified":
+            if path not in self.created:
+                self.updated.add(path)
+        elif kind == "deleted":
+            src = self._moved_source(path)
+            self.updated.discard(path)
+            if path in self.created:
+                self.created.discard(path)
+            elif src is not None:
+                del self.moved[src]
+                self.deleted.add(src)
+            else:
+                self.deleted.add(path)
+        elif kind == "moved":
+            src = self._moved_source(path)
+            if path in self.created:
+                self.created.discard(path)
+                self.created.add(dest)
+            elif src is not None:
+                self.moved[src] = dest
+            else:
+                if path in self.updated:
+                    self.updated.discard(path)
+                    self.updated.add(dest)
+                self.moved[path] = dest
+
+
+class _WatchdogHandler:
+    """Handler pro watchdog Observer (stačí mu metoda dispatch)"""
+
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def dispatch(self, event):
+        if event.is_directory:
+            return
+        if event.event_type == "moved":
+            self.watcher.record("moved", event.src_path, event.dest_path)
+        elif event.event_type in ("created", "modified", "deleted"):
+            self.watcher.record(event.event_type, event.src_path)
+
+
+class LibraryWatcher:
+    """Sleduje hudební složku (inotify přes watchdog, jinak polling) a průběžně synchronizuje knihovnu"""
+
+    def __init__(self, scanner, directory, on_change=None, debounce=2.0, max_delay=30.0,
+                 poll_interval=5.0, max_files_per_second=20):
+        self.scanner = scanner
+        self.directory = str(Path(directory))
+        self.on_change = on_change
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.max_files_per_second = max_files_per_second
+
+        self._lock = threading.Lock()
+        self._changes = LibraryChangeSet()
+        self._first_event = None
+        self._last_event = None
+        self._stop = threading.Event()
+        self._observer = None
+        self._thread = None
+        self._snapshot = None
+        # Volitelné: inotify/FSEvents sledování přes watchdog, jinak polling
+        # (zjišťuje se jednou a bez importu, ten proběhne až ve vlákně sledování)
+        self.uses_polling = importlib.util.find_spec("watchdog") is None
+
+    def start(self):
+        """Spustí sledování - indexy, první snímek složky i observer se připraví
+        ve vlákně sledování, volající (Tk smyčka) na ně nečeká"""
+        self._thread = threading.Thread(target=self._run, daemon=True, name="library-watcher")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _setup(self):
+        self.scanner.ensure_indexes()
+        if self.uses_polling:
+            self._snapshot = self._take_snapshot()
+        else:
+            self._observer = lazy_import("watchdog.observers").Observer()
+            self._observer.schedule(_WatchdogHandler(self), self.directory, recursive=True)
+            self._observer.start()
+
+    def record(self, kind, path, dest=None):
+        """Zaznamená událost souborového systému (volá se z vlákna sledování)"""
+        path = str(Path(path))
+        dest = str(Path(dest)) if dest else None
+        is_mp3 = path.endswith(".mp3")
+        if kind == "moved" and not dest.endswith(".mp3"):
+            kind, dest = "deleted", None
+        elif kind == "moved" and not is_mp3:
+            kind, path, dest, is_mp3 = "created", dest, None, True
+        if not is_mp3:
+            return
+
+        with self._lock:
+            self._changes.add(kind, path, dest)
+            now = time.monotonic()
+            self._first_event = self._first_event or now
+            self._last_event = now
+
+    def _run(self):
+        try:
+            self._setup()
+        except Exception as e:
+            print(f"Nelze spustit sledování složky: {e}")
+            return
+        try:
+            self._watch()
+        finally:
+            if self._observer:
+                self._observer.stop()
+                self._observer.join()
+                self._observer = None
+
+    def _watch(self):
+        last_poll = time.monotonic()
+        while not self._stop.wait(0.5):
+            if self.uses_polling and time.monotonic() - last_poll >= self.poll_interval:
+                self._poll()
+                last_poll = time.monotonic()
+
+            with self._lock:
+                if not self._changes:
+                    continue
+                now = time.monotonic()
+                quiet = now - self._last_event >= self.debounce
+                overdue = now - self._first_event >= self.max_delay
+                if not (quiet or overdue):
+                    continue
+                changes = self._changes
+                self._changes = LibraryChangeSet()
+                self._first_event = self._last_event = None
+
+            try:
+                summary = self.scanner.apply_changes(changes, self.max_files_per_second)
+                if self.on_change:
+                    self.on_change(summary)
+            except Exception as e:
+                print(f"Chyba při synchronizaci knihovny: {e}")
+
+    def _take_snapshot(self):
+        snapshot = {}
+        for file_path in Path(self.directory).rglob("*.mp3"):
+            if self._stop.is_set():
+                break  # zastavení během prvního snímku velké knihovny
+            try:
+                stat = file_path.stat()
+            except OSError:
+                continue
+            snapshot[str(file_path)] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def _poll(self):
+        current = self._take_snapshot()
+        previous = self._snapshot
+        for path, signature in current.items():
+            if path not in previous:
+                self.record("created", path)
+            elif previous[path] != signature:
+                self.record("modified", path)
+        for path in previous.keys() - current.keys():
+            self.record("deleted", path)
+        self._snapshot = current
+
+
+class TrackCatalogue:
+    """Kompaktní sloupcový katalog skladeb.
+
+    Umělci, žánry, obaly a složky jsou uloženy jen jednou v tabulkách a skladby
+    na ně odkazují indexem v poli. Délky jsou v poli `array`, takže na skladbu
+    připadá jen pár desítek bajtů kromě samotného názvu a jména souboru.
+    Řádek jako slovník (stejný tvar jako get_all_tracks) vzniká až při přístupu.
+    """
+
+    FIELDS = ("trackId", "title", "duration", "filePath", "artist", "artistId", "genre", "artHash")
+
+    def __init__(self, rows=()):
+        self._artists = []          # (artistId, jméno)
+        self._artist_refs = {}
+        self._genres = []
+        self._genre_refs = {}
+        self._art_hashes = []
+        self._art_refs = {}
+        self._dirs = []
+        self._dir_refs = {}
+
+        self.track_ids = []
+        self.titles = []
+        self.file_names = []
+        self.dirs = array('i')      # -1 = v file_names je celá cesta
+        self.durations = array('I')
+        self.artists = array('I')
+        self.genres = array('i')    # -1 = bez žánru
+        self.art = array('i')       # -1 = bez obalu
+
+        for row in rows:
+            self.append(row)
+
+    @staticmethod
+    def _intern(table, refs, value):
+        ref = refs.get(value)
+        if ref is None:
+            ref = refs[value] = len(table)
+            table.append(value)
+        return ref
+
+    def append(self, row):
+        """Přidá skladbu (slovník ve tvaru get_all_tracks) a vrátí její index"""
+        file_path = row.get('filePath') or ""
+        directory, file_name = os.path.split(file_path)
+        if directory and os.path.join(directory, file_name) == file_path:
+            self.dirs.append(self._intern(self._dirs, self._dir_refs, directory))
+            self.file_names.append(file_name)
+        else:
+            self.dirs.append(-1)
+            self.file_names.append(file_path)
+
+        genre = row.get('genre')
+        art_hash = row.get('artHash')
+        self.track_ids.append(row['trackId'])
+        self.titles.append(row.get('title') or "")
+        self.durations.append(row.get('duration') or 0)
+        self.artists.append(self._intern(self._artists, self._artist_refs,
+                                         (row.get('artistId'), row.get('artist'))))
+        self.genres.append(self._intern(self._genres, self._genre_refs, genre)
+                           if genre is not None else -1)
+        self.art.append(self._intern(self._art_hashes, self._art_refs, art_hash)
+                        if art_hash else -1)
+        return len(self.track_ids) - 1
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    def __getitem__(self, i):
+        artist_id, artist = self._artists[self.artists[i]]
+        return {
+            "trackId": self.track_ids[i],
+            "title": self.titles[i],
+            "duration": self.durations[i],
+            "filePath": self.file_path(i),
+            "artist": artist,
+            "artistId": artist_id,
+            "genre": self._genres[self.genres[i]] if self.genres[i] >= 0 else None,
+            "artHash": self._art_hashes[self.art[i]] if self.art[i] >= 0 else None,
+        }
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def file_path(self, i):
+        if self.dirs[i] < 0:
+            return self.file_names[i]
+        return os.path.join(self._dirs[self.dirs[i]], self.file_names[i])
+
+    def artist_name(self, i):
+        return self._artists[self.artists[i]][1]
+
+    def genre_name(self, i):
+        return self._genres[self.genres[i]] if self.genres[i] >= 0 else None
+
+    def display_text(self, i):
+        return f"{self.titles[i]} - {self.artist_name(i)}"
+
+    def view(self):
+        """Pohled na celý katalog v pořadí vložení"""
+        return CatalogueView(self, array('I', range(len(self))))
+
+    def remove_paths(self, paths):
+        """Odstraní skladby podle cesty (pohledy vytvořené dříve tím přestávají platit)"""
+        if not paths:
+            return
+        keep = [i for i in range(len(self)) if self.file_path(i) not in paths]
+        if len(keep) == len(self):
+            return
+
+        self.track_ids = [self.track_ids[i] for i in keep]
+        self.titles = [self.titles[i] for i in keep]
+        self.file_names = [self.file_names[i] for i in keep]
+        for name in ("dirs", "durations", "artists", "genres", "art"):
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode, (column[i] for i in keep)))
+
+    def move_paths(self, moves):
+        """Přepíše cesty přesunutých souborů {stará cesta: nová cesta}"""
+        if not moves:
+            return
+        for i in range(len(self)):
+            new_path = moves.get(self.file_path(i))
+            if new_path is None:
+                continue
+            directory, file_name = os.path.split(new_path)
+            if directory and os.path.join(directory, file_name) == new_path:
+                self.dirs[i] = self._intern(self._dirs, self._dir_refs, directory)
+                self.file_names[i] = file_name
+            else:
+                self.dirs[i] = -1
+                self.file_names[i] = new_path
+
+
+class CatalogueView:
+    """Seřazený/filtrovaný pohled na TrackCatalogue - drží jen pole indexů"""
+
+    def __init__(self, catalogue, indices):
+        self.catalogue = catalogue
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        return self.catalogue[self.indices[i]]
+
+    def __iter__(self):
+        return (self.catalogue[i] for i in self.indices)
+
+    def display_text(self, i):
+        return self.catalogue.display_text(self.indices[i])
+
+    def sorted(self, field="title", reverse=False):
+        cat = self.catalogue
+        keys = {
+            "title": lambda i: cat.titles[i].casefold(),
+            "artist": lambda i: (cat.artist_name(i) or "").casefold(),
+            "genre": lambda i: (cat.genre_name(i) or "").casefold(),
+            "duration": lambda i: cat.durations[i],
+        }
+        return CatalogueView(cat, array('I', sorted(self.indices, key=keys[field], reverse=reverse)))
+
+    def filter(self, text):
+        """Skladby, jejichž název nebo umělec obsahuje text"""
+        cat = self.catalogue
+        text = text.casefold()
+        return CatalogueView(cat, array('I', (i for i in self.indices
+                                              if text in cat.titles[i].casefold()
+                                              or text in (cat.artist_name(i) or "").casefold())))
+
+
+CACHE_DIR = Path.home() / ".neo4j_music_player"
+
+
+class LocalLibraryCache:
+    """Lokální SQLite zrcadlo katalogu (Track, Artist, Genre) a stavu přihlášeného uživatele.
+
+    Čtení knihovny, vyhledávání a stav fanouška jdou z lokální kopie, zápisy jdou
+    do Neo4j a do kopie se propíšou. Katalog se synchronizuje přírůstkově podle
+    vlastnosti `lastModified` na uzlech Track.
+    """
+
+    SYNC_BATCH_SIZE = 5000
+    # Sloupce s ID nemají typ - číselná (64bitová) i stará textová ID se uloží beze změny
+    SCHEMA_VERSION = 2
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._synced_users = set()
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock, self.db:
+            # Cache starší verze se zahodí a stáhne znovu
+            if self.db.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+                self.db.executescript("""
+                DROP TABLE IF EXISTS tracks; DROP TABLE IF EXISTS artists;
+                DROP TABLE IF EXISTS genres; DROP TABLE IF EXISTS fans;
+                DROP TABLE IF EXISTS listens; DROP TABLE IF EXISTS meta;
+                """)
+                self.db.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS tracks (
+                track_id PRIMARY KEY, title TEXT, duration INTEGER, file_path TEXT,
+                artist_id, genre TEXT, art_hash TEXT, last_modified INTEGER);
+            CREATE INDEX IF NOT EXISTS tracks_title ON tracks(title);
+            CREATE TABLE IF NOT EXISTS artists (artist_id PRIMARY KEY, name TEXT);
+            CREATE TABLE IF NOT EXISTS genres (name TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS fans (
+                user_id, artist_id, PRIMARY KEY (user_id, artist_id));
+            CREATE TABLE IF NOT EXISTS listens (
+                user_id, track_id, listen_date TEXT, listen_duration INTEGER,
+                PRIMARY KEY (user_id, track_id));
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+            """)
+
+    @classmethod
+    def for_database(cls, uri):
+        """Samostatná cache pro každou databázi (podle URI)"""
+        return cls(CACHE_DIR / f"cache_{hashlib.md5(uri.encode()).hexdigest()[:8]}.sqlite")
+
+    def close(self):
+        self.db.close()
+
+    def _meta(self, key, default=None):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    # --- Katalog ---
+    def sync_catalogue(self, conn):
+        """Stáhne skladby změněné od poslední synchronizace, vrací počet změn"""
+        since = self._meta("tracks_watermark")
+        # Čas serveru na začátku - co se změní během synchronizace, přijde příště znovu
+        started = conn.query("RETURN timestamp() as now")[0]['now']
+        query = """
+        MATCH (t:Track)-[:IS_PERFORMED_BY]->(a:Artist)
+        WHERE $since IS NULL OR t.lastModified >= $since
+        OPTIONAL MATCH (t)-[:BELONGS_TO]->(g:Genre)
+        RETURN t.trackId as trackId, t.title as title, t.duration as duration,
+               t.filePath as filePath, a.name as artist, a.artistId as artistId,
+               g.name as genre, t.artHash as artHash, t.lastModified as lastModified
+        """
+        changed = self._store_tracks(conn.stream(query, {"since": since}))
+        changed += self._reconcile(conn)
+
+        with self._lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('tracks_watermark', ?)", (started,))
+        return changed
+
+    def _store_tracks(self, rows):
+        changed = 0
+        batch = []
+
+        def write(batch):
+            with self._lock, self.db:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(r['trackId'], r['title'], r['duration'], r['filePath'], r['artistId'],
+                      r['genre'], r['artHash'], r.get('lastModified')) for r in batch])
+                self.db.executemany("INSERT OR REPLACE INTO artists VALUES (?, ?)",
+                                    {(r['artistId'], r['artist']) for r in batch})
+                self.db.executemany("INSERT OR IGNORE INTO genres VALUES (?)",
+                                    {(r['genre'],) for r in batch if r['genre'] is not None})
+
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.SYNC_BATCH_SIZE:
+                write(batch)
+                changed += len(batch)
+                batch = []
+        if batch:
+            write(batch)
+            changed += len(batch)
+        return changed
+
+    def _reconcile(self, conn):
+        """Smazané skladby a uzly bez lastModified (např. po offline importu) se
+        nepoznají podle značky času - při nesouhlasu počtů se porovnají ID"""
+        remote_count = conn.query("""
+        MATCH (t:Track) WHERE EXISTS { (t)-[:IS_PERFORMED_BY]->() }
+        RETURN count(t) as count
+        """)[0]['count']
+        local_count = self.db.execute("SELECT count(*) FROM tracks").fetchone()[0]
+        if remote_count == local_count:
+            return 0
+
+        remote_ids = {row['trackId'] for row in conn.stream("""
+        MATCH (t:Track) WHERE EXISTS { (t)-[:IS_PERFORMED_BY]->() }
+        RETURN t.trackId as trackId
+        """)}
+        local_ids = {row[0] for row in self.db.execute("SELECT track_id FROM tracks")}
+
+        removed = local_ids - remote_ids
+        with self._lock, self.db:
+            self.db.executemany("DELETE FROM tracks WHERE track_id = ?", [(i,) for i in removed])
+
+        missing = list(remote_ids - local_ids)
+        query = """
+        MATCH (t:Track)-[:IS_PERFORMED_BY]->(a:Artist)
+        WHERE t.trackId IN $ids
+        OPTIONAL MATCH (t)-[:BELONGS_TO]->(g:Genre)
+        RETURN t.trackId as trackId, t.title as title, t.duration as duration,
+               t.filePath as filePath, a.name as artist, a.artistId as artistId,
+               g.name as genre, t.artHash as artHash, t.lastModified as lastModified
         """
-        return self.conn.query(query)
+        added = 0
+        for i in range(0, len(missing), self.SYNC_BATCH_SIZE):
+            added += self._store_tracks(conn.stream(query, {"ids": missing[i:i + self.SYNC_BATCH_SIZE]}))
+        return len(removed) + added
+
+    def load_catalogue(self):
+        """Katalog skladeb z lokální kopie (stejný tvar jako get_all_tracks)"""
+        cursor = self.db.execute("""
+        SELECT t.track_id, t.title, t.duration, t.file_path, a.name, t.artist_id, t.genre, t.art_hash
+        FROM tracks t LEFT JOIN artists a ON a.artist_id = t.artist_id
+        ORDER BY t.title
+        """)
+        return TrackCatalogue(dict(zip(TrackCatalogue.FIELDS, row)) for row in cursor)
+
+    # --- Stav uživatele ---
+    def sync_user(self, conn, user_id):
+        """Stáhne oblíbené umělce a poslechy uživatele (jedna transakce)"""
+        results = conn.query_batch([
+            ("fans", """
+            MATCH (u:User) WHERE u.userId = $user_id OR u.legacyId = $user_id
+            MATCH (u)-[:IS_A_FAN_OF]->(a:Artist)
+            RETURN a.artistId as artistId
+            """, {"user_id": user_id}),
+            ("listens", """
+            MATCH (u:User) WHERE u.userId = $user_id OR u.legacyId = $user_id
+            MATCH (u)-[l:LISTENED_TO]->(t:Track)
+            RETURN t.trackId as trackId, l.listenDate as listenDate, l.listenDuration as listenDuration
+            """, {"user_id": user_id}),
+        ])
+        with self._lock, self.db:
+            self.db.execute("DELETE FROM fans WHERE user_id = ?", (user_id,))
+            self.db.execute("DELETE FROM listens WHERE user_id = ?", (user_id,))
+            self.db.executemany("INSERT INTO fans VALUES (?, ?)",
+                                [(user_id, row['artistId']) for row in results["fans"]])
+            self.db.executemany("INSERT INTO listens VALUES (?, ?, ?, ?)",
+                                [(user_id, row['trackId'], row['listenDate'], row['listenDuration'])
+                                 for row in results["listens"]])
+        self._synced_users.add(user_id)
+
+    def has_user(self, user_id):
+        return user_id in self._synced_users
+
+    def has_listens(self, user_id):
+        row = self.db.execute("SELECT 1 FROM listens WHERE user_id = ? LIMIT 1", (user_id,)).fetchone()
+        return row is not None
+
+    def is_fan(self, user_id, artist_id):
+        row = self.db.execute("SELECT 1 FROM fans WHERE user_id = ? AND artist_id = ?",
+                              (user_id, artist_id)).fetchone()
+        return row is not None
+
+    def set_fan(self, user_id, artist_id, is_fan):
+        with self._lock, self.db:
+            if is_fan:
+                self.db.execute("INSERT OR IGNORE INTO fans VALUES (?, ?)", (user_id, artist_id))
+            else:
+                self.db.execute("DELETE FROM fans WHERE user_id = ? AND artist_id = ?",
+                                (user_id, artist_id))
+
+    def record_listen(self, user_id, track_id, listen_duration, listen_date):
+        with self._lock, self.db:
+            self.db.execute("""
+            INSERT INTO listens VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id, track_id) DO UPDATE SET
+                listen_date = excluded.listen_date,
+                listen_duration = listen_duration + excluded.listen_duration
+            """, (user_id, track_id, listen_date, listen_duration))
 
 
 # === 4. DOPORUČOVACÍ SYSTÉMY ===
+class PopularityLeaderboards:
+    """Žebříčky nejposlouchanějších skladeb (globální a podle žánru) pro nové uživatele.
+
+    Poslechy se počítají v hodinových přihrádkách. Okna 24h a 7d jsou součtem posledních
+    24 / 168 přihrádek a při posunu času se z nich vypadlé přihrádky odečtou. Pro každé
+    okno a žánr se drží jen seřazený seznam top-K, dotaz je tak jen výřez seznamu.
+    """
+
+    WINDOWS = {"24h": 24, "7d": 24 * 7, "all": None}  # délka okna v hodinách
+    MAX_HOURS = 24 * 7
+
+    def __init__(self, top_k=100):
+        self.top_k = top_k
+        self._lock = threading.Lock()
+        self._genres = {}    # trackId -> žánr (skladby, které už mají poslech)
+        self._buckets = {}   # hodina -> {trackId: počet poslechů}
+        self._counts = {window: {} for window in self.WINDOWS}  # okno -> žánr (None = vše) -> {trackId: počet}
+        self._top = {window: {} for window in self.WINDOWS}     # okno -> žánr -> [(-počet, trackId)]
+        self._hour = self._hour_of(None)
+
+    @staticmethod
+    def _hour_of(listen_date):
+        """Číslo hodiny od epochy; None = teď, nečitelné datum vrací None"""
+        if listen_date is None:
+            return int(time.time() // 3600)
+        try:
+            return int(datetime.fromisoformat(listen_date).timestamp() // 3600)
+        except (TypeError, ValueError):
+            return None
+
+    def knows(self, track_id):
+        return track_id in self._genres
+
+    def genre_of(self, track_id):
+        return self._genres.get(track_id)
+
+    def record(self, track_id, genre, listen_date=None):
+        """Započítá jeden poslech (volá se při každém zaznamenaném poslechu)"""
+        with self._lock:
+            self._advance(self._hour_of(None))
+            self._genres[track_id] = genre
+            for scope in self._scopes(genre):
+                self._promote("all", scope, track_id, self._bump("all", scope, track_id, 1))
+            self._add_timed(track_id, genre, self._hour_of(listen_date), 1, promote=True)
+
+    def top(self, window="7d", genre=None, limit=10):
+        """Seznam (trackId, počet poslechů) sestupně; genre=None je globální žebříček"""
+        with self._lock:
+            self._advance(self._hour_of(None))
+            return [(track_id, -neg) for neg, track_id in self._top[window].get(genre, [])[:limit]]
+
+    def bootstrap(self, conn):
+        """Jednorázové naplnění z databáze. LISTENED_TO drží jen poslední poslech,
+        výchozí stav proto počítá jeden poslech na posluchače skladby."""
+        since = datetime.fromtimestamp((self._hour_of(None) - self.MAX_HOURS + 1) * 3600).isoformat()
+        rows = list(conn.stream("""
+        MATCH (t:Track)<-[l:LISTENED_TO]-()
+        WITH t, count(l) as total, collect(l.listenDate) as dates
+        OPTIONAL MATCH (t)-[:BELONGS_TO]->(g:Genre)
+        RETURN t.trackId as trackId, head(collect(g.name)) as genre, total,
+               [d IN dates WHERE d >= $since] as recent
+        """, {"since": since}))
+
+        with self._lock:
+            self._advance(self._hour_of(None))
+            for row in rows:
+                self._genres[row['trackId']] = row['genre']
+                for scope in self._scopes(row['genre']):
+                    self._bump("all", scope, row['trackId'], row['total'])
+                for listen_date in row['recent']:
+                    self._add_timed(row['trackId'], row['genre'], self._hour_of(listen_date), 1)
+            for window, scopes in self._counts.items():
+                for scope in list(scopes):
+                    self._rebuild(window, scope)
+
+    # --- Údržba (vše pod zámkem) ---
+    @staticmethod
+    def _scopes(genre):
+        return (None, genre) if genre else (None,)
+
+    def _bump(self, window, scope, track_id, delta):
+        counts = self._counts[window].setdefault(scope, {})
+        count = counts.get(track_id, 0) + delta
+        if count > 0:
+            counts[track_id] = count
+        else:
+            counts.pop(track_id, None)
+        return count
+
+    def _add_timed(self, track_id, genre, hour, n, promote=False):
+        """Přičte poslechy z dané hodiny do přihrádky a do oken 24h/7d, kam hodina patří"""
+        if hour is None or hour <= self._hour - self.MAX_HOURS:
+            return
+        bucket = self._buckets.setdefault(hour, {})
+        bucket[track_id] = bucket.get(track_id, 0) + n
+        for window, hours in self.WINDOWS.items():
+            if hours is not None and hour > self._hour - hours:
+                for scope in self._scopes(genre):
+                    count = self._bump(window, scope, track_id, n)
+                    if promote:
+                        self._promote(window, scope, track_id, count)
+
+    def _promote(self, window, scope, track_id, count):
+        """Zařadí skladbu s vyšším počtem do top-K (počty jen rostou, stačí O(K))"""
+        top = self._top[window].setdefault(scope, [])
+        for i, (_, ranked_id) in enumerate(top):
+            if ranked_id == track_id:
+                del top[i]
+                break
+        if len(top) < self.top_k or -top[-1][0] < count:
+            bisect.insort(top, (-count, track_id))
+            del top[self.top_k:]
+
+    def _rebuild(self, window, scope):
+        counts = self._counts[window].get(scope)
+        if not counts:
+            self._counts[window].pop(scope, None)
+            self._top[window].pop(scope, None)
+            return
+        self._top[window][scope] = heapq.nsmallest(
+            self.top_k, ((-count, track_id) for track_id, count in counts.items()))
+
+    def _advance(self, now):
+        """Posune okna na aktuální hodinu - vypadlé přihrádky se odečtou a dotčené
+        žebříčky přepočítají (nejvýš jednou za hodinu)"""
+        if now <= self._hour:
+            return
+        previous, self._hour = self._hour, now
+
+        dirty = set()
+        for window, hours in self.WINDOWS.items():
+            if hours is None:
+                continue
+            for hour in [h for h in self._buckets if previous - hours < h <= now - hours]:
+                for track_id, n in self._buckets[hour].items():
+                    for scope in self._scopes(self._genres.get(track_id)):
+                        self._bump(window, scope, track_id, -n)
+                        dirty.add((window, scope))
+
+        for hour in [h for h in self._buckets if h <= now - self.MAX_HOURS]:
+            del self._buckets[hour]
+        for window, scope in dirty:
+            self._rebuild(window, scope)
+
+
 class MusicRecommender:
-    def __init__(self, neo4j_conn):
-        self.conn = neo4j_conn
+    COLD_START_WINDOWS = ("7d", "all")  # žebříčky pro uživatele bez poslechů (v tomto pořadí)
+    # Verze hran AFFINE_TO - zvýšení vynutí jednorázový přepočet ve všech databázích
+    # (např. po opravě zápisu, který afinity neudržoval)
+    AFFINITY_VERSION = 2
 
-    def collaborative_filtering(self, user_id, limit=10):
+    def __init__(self, neo4j_conn, local_cache=None, leaderboards=None):
+        self.conn = neo4j_conn
+        # Volitelná LocalLibraryCache: stav fanouška se čte z ní, zápisy se do ní propisují
+        self.local_cache = local_cache
+        # Volitelné PopularityLeaderboards: odpovědi pro uživatele bez poslechů
+        self.leaderboards = leaderboards
+        self._warm_users = set()    # uživatelé, o kterých už víme, že mají poslechy
+        self._track_details = {}    # trackId -> řádek skladby pro odpovědi ze žebříčků
+
+    def _cached_user(self, user_id):
+        return self.local_cache is not None and self.local_cache.has_user(user_id)
+
+    def _is_cold_start(self, user_id):
+        """Uživatel bez jediného poslechu (výsledek "má poslechy" se pamatuje)"""
+        if self.leaderboards is None or user_id in self._warm_users:
+            return False
+        if self._cached_user(user_id):
+            has_listens = self.local_cache.has_listens(user_id)
+        else:
+            result = self.conn.query("""
+            MATCH (u:User) WHERE u.userId = $user_id OR u.legacyId = $user_id
+            RETURN EXISTS { (u)-[:LISTENED_TO]->() } as has_listens
+            """, {"user_id": user_id})
+            has_listens = bool(result) and result[0]['has_listens']
+        if has_listens:
+            self._warm_users.add(user_id)
+        return not has_listens
+
+    def popular_for_new_user(self, limit=10, exclude=(), genre=None):
+        """Doporučení ze žebříčků popularity - bez průchodu grafem"""
+        excluded = set(exclude)
+        ranked = {}
+        for window in self.COLD_START_WINDOWS:
+            for track_id, count in self.leaderboards.top(window, genre, self.leaderboards.top_k):
+                if track_id not in excluded and track_id not in ranked:
+                    ranked[track_id] = count
+                if len(ranked) >= limit:
+                    break
+            if len(ranked) >= limit:
+                break
+
+        missing = [track_id for track_id in ranked if track_id not in self._track_details]
+        if missing:
+            for row in self.conn.query("""
+            MATCH (t:Track)-[:IS_PERFORMED_BY]->(a:Artist)
+            WHERE t.trackId IN $ids
+            OPTIONAL MATCH (t)-[:BELONGS_TO]->(g:Genre)
+            RETURN t.trackId as trackId, t.title as title, a.name as artist, a.artistId as artistId,
+                   g.name as genre, t.filePath as filePath, t.duration as duration, t.artHash as artHash
+            """, {"ids": missing}):
+                self._track_details[row['trackId']] = row
+
+        return [dict(self._track_details[track_id], popularity=count)
+                for track_id, count in ranked.items() if track_id in self._track_details]
+
+    def _record_popularity(self, user_id, track_id, listen_date):
+        """Poslech se započítá do žebříčků, uživatel už není "nový" """
+        self._warm_users.add(user_id)
+        if self.leaderboards is None:
+            return
+        if self.leaderboards.knows(track_id):
+            genre = self.leaderboards.genre_of(track_id)
+        else:
+            result = self.conn.query("""
+            MATCH (t:Track) WHERE t.trackId = $track_id OR t.legacyId = $track_id
+            OPTIONAL MATCH (t)-[:BELONGS_TO]->(g:Genre)
+            RETURN g.name as genre
+            """, {"track_id": track_id})
+            genre = result[0]['genre'] if result else None
+        self.leaderboards.record(track_id, genre, listen_date)
+
+    def collaborative_filtering(self, user_id, limit=10, exclude=()):
         """Kolaborativní filtrování"""
+        if self._is_cold_start(user_id):
+            return self.popular_for_new_user(limit, exclude)
+        return self.conn.query(*self._collaborative_query(user_id, limit, exclude))
+
+    @staticmethod
+    def _collaborative_query(user_id, limit, exclude=()):
         query = """
-        MATCH (u:User {userId: $user_id})-[l1:LISTENED_TO]->(t:Track)
+        MATCH (u:User) WHERE u.userId = $user_id OR u.legacyId = $user_id
+        MATCH (u)-[l1:LISTENED_TO]->(t:Track)
         WITH u, collect(t) as user_tracks
 
         MATCH (other:User)-[l2:LISTENED_TO]->(t2:Track)
@@ -173,7 +1939,7 @@ class MusicRecommender:
         LIMIT 10
 
         MATCH (other)-[:LISTENED_TO]->(rec:Track)
-        WHERE NOT rec IN user_tracks
+        WHERE NOT rec IN user_tracks AND NOT rec.trackId IN $exclude
         WITH rec, count(DISTINCT other) as popularity
         ORDER BY popularity DESC
         LIMIT $limit
@@ -182,21 +1948,29 @@ class MusicRecommender:
         OPTIONAL MATCH (rec)-[:BELONGS_TO]->(g:Genre)
         RETURN rec.trackId as trackId, rec.title as title, 
                a.name as artist, a.artistId as artistId, g.name as genre, 
-               rec.filePath as filePath, popularity
+               rec.filePath as filePath, rec.duration as duration, rec.artHash as artHash,
+               popularity
         """
-        return self.conn.query(query, {"user_id": user_id, "limit": limit})
+        return query, {"user_id": user_id, "limit": limit, "exclude": list(exclude)}
 
-    def content_based_filtering(self, user_id, limit=10):
+    def content_based_filtering(self, user_id, limit=10, exclude=()):
         """Filtrování založené na obsahu"""
+        if self._is_cold_start(user_id):
+            return self.popular_for_new_user(limit, exclude)
+        return self.conn.query(*self._content_query(user_id, limit, exclude))
+
+    @staticmethod
+    def _content_query(user_id, limit, exclude=()):
         query = """
-        MATCH (u:User {userId: $user_id})-[:LISTENED_TO]->(t:Track)
+        MATCH (u:User) WHERE u.userId = $user_id OR u.legacyId = $user_id
+        MATCH (u)-[:LISTENED_TO]->(t:Track)
         MATCH (t)-[:BELONGS_TO]->(g:Genre)
         MATCH (t)-[:IS_PERFORMED_BY]->(a:Artist)
         WITH u, collect(DISTINCT g) as user_genres, collect(DISTINCT a) as user_artists,
              collect(t) as listened_tracks
 
         MATCH (rec:Track)-[:BELONGS_TO]->(g2:Genre)
-        WHERE g2 IN user_genres AND NOT rec IN listened_tracks
+        WHERE g2 IN user_genres AND NOT rec IN listened_tracks AND NOT rec.trackId IN $exclude
         MATCH (rec)-[:IS_PERFORMED_BY]->(a2:Artist)
         WITH rec, a2, 
              CASE WHEN a2 IN user_artists THEN 2 ELSE 1 END as score
@@ -206,19 +1980,28 @@ class MusicRecommender:
         OPTIONAL MATCH (rec)-[:BELONGS_TO]->(g:Genre)
         RETURN rec.trackId as trackId, rec.title as title,
                a2.name as artist, a2.artistId as artistId, g.name as genre, 
-               rec.filePath as filePath, score
+               rec.filePath as filePath, rec.duration as duration, rec.artHash as artHash,
+               score
         """
-        return self.conn.query(query, {"user_id": user_id, "limit": limit})
+        return query, {"user_id": user_id, "limit": limit, "exclude": list(exclude)}
 
-    def hybrid_recommendation(self, user_id, limit=10, alpha=0.6):
+    def hybrid_recommendation(self, user_id, limit=10, alpha=0.6, exclude=()):
         """Hybridní doporučení s parametrem Alpha"""
+        if self._is_cold_start(user_id):
+            return self.popular_for_new_user(limit, exclude)
+        return self.conn.query(*self._hybrid_query(user_id, limit, alpha, exclude))
+
+    @staticmethod
+    def _hybrid_query(user_id, limit, alpha, exclude=()):
         query = """
         // Najdeme samotného uživatele
-        MATCH (u:User {userId: $user_id})
+        MATCH (u:User) WHERE u.userId = $user_id OR u.legacyId = $user_id
 
         // Zjistíme historii
         OPTIONAL MATCH (u)-[:LISTENED_TO]->(t:Track)
         WITH u, collect(DISTINCT t) as listened_tracks
+        // Bez historie nemůže žádná skladba získat skóre - nemá smysl procházet katalog
+        WHERE size(listened_tracks) > 0
 
         // Zjistíme oblíbené žánry
         OPTIONAL MATCH (u)-[:LISTENED_TO]->(:Track)-[:BELONGS_TO]->(g:Genre)
@@ -230,7 +2013,7 @@ class MusicRecommender:
 
         // Hledáme kandidáty
         MATCH (rec:Track)
-        WHERE NOT rec IN listened_tracks
+        WHERE NOT rec IN listened_tracks AND NOT rec.trackId IN $exclude
 
         // Výpočet dílčích skóre
         
@@ -256,114 +2039,500 @@ class MusicRecommender:
         MATCH (rec)-[:IS_PERFORMED_BY]->(a:Artist)
         OPTIONAL MATCH (rec)-[:BELONGS_TO]->(g:Genre)
         RETURN rec.trackId as trackId, rec.title as title,
-               a.name as artist, g.name as genre, rec.filePath as filePath,
+               a.name as artist, a.artistId as artistId, g.name as genre, rec.filePath as filePath,
+               rec.duration as duration, rec.artHash as artHash,
                final_score as score
         """
-        return self.conn.query(query, {
+        return query, {
             "user_id": user_id,
             "limit": limit,
-            "alpha": alpha
-        })
+            "alpha": alpha,
+            "exclude": list(exclude)
+        }
+
+    def popular_tracks(self, limit=10, exclude=()):
+        """Nejposlouchanější skladby (záloha, když personalizovaná doporučení došla).
+        Se žebříčky popularity se čtou z paměti - rádio pak končí s jejich top-K;
+        průchod celým katalogem zůstává jen pro běh bez žebříčků."""
+        if self.leaderboards is not None:
+            return self.popular_for_new_user(limit, exclude)
+
+        query = """
+        MATCH (rec:Track)
+        WHERE NOT rec.trackId IN $exclude
+        WITH rec, COUNT { (rec)<-[:LISTENED_TO]-() } as popularity
+        ORDER BY popularity DESC, rand()
+        LIMIT $limit
+
+        MATCH (rec)-[:IS_PERFORMED_BY]->(a:Artist)
+        OPTIONAL MATCH (rec)-[:BELONGS_TO]->(g:Genre)
+        RETURN rec.trackId as trackId, rec.title as title,
+               a.name as artist, a.artistId as artistId, g.name as genre, rec.filePath as filePath,
+               rec.duration as duration, rec.artHash as artHash, popularity
+        """
+        return self.conn.query(query, {"limit": limit, "exclude": list(exclude)})
 
     def record_listen(self, user_id, track_id, listen_duration, listen_date):
         """Zaznamenání poslechu skladby"""
+        self.conn.query(*self._record_listen_query(user_id, track_id, listen_duration, listen_date))
+        if self._cached_user(user_id):
+            self.local_cache.record_listen(user_id, track_id, listen_duration, listen_date)
+        self._record_popularity(user_id, track_id, listen_date)
+
+    @staticmethod
+    def _record_listen_query(user_id, track_id, listen_duration, listen_date):
         query = """
-        MATCH (u:User {userId: $user_id}), (t:Track {trackId: $track_id})
+        MATCH (u:User) WHERE u.userId = $user_id OR u.legacyId = $user_id
+        MATCH (t:Track) WHERE t.trackId = $track_id OR t.legacyId = $track_id
+        OPTIONAL MATCH (u)-[existing:LISTENED_TO]->(t)
+        WITH u, t, existing IS NULL as is_new
         MERGE (u)-[l:LISTENED_TO]->(t)
         ON CREATE SET l.listenDate = $listen_date, l.listenDuration = $listen_duration
         ON MATCH SET l.listenDate = $listen_date, l.listenDuration = l.listenDuration + $listen_duration
+
+        // Nový poslech zvýší afinitu všech umělců, jejichž je uživatel fanouškem
+        WITH u, t, is_new
+        WHERE is_new
+        MATCH (t)-[:IS_PERFORMED_BY]->(other:Artist)
+        MATCH (u)-[:IS_A_FAN_OF]->(a:Artist)
+        WHERE a <> other
+        MERGE (a)-[r:AFFINE_TO]->(other)
+        ON CREATE SET r.strength = 1
+        ON MATCH SET r.strength = r.strength + 1
         """
-        self.conn.query(query, {
+        return query, {
             "user_id": user_id,
             "track_id": track_id,
             "listen_duration": listen_duration,
             "listen_date": listen_date
-        })
+        }
 
     def add_fan_relationship(self, user_id, artist_id):
         """Přidání vazby IS_A_FAN_OF"""
         query = """
-        MATCH (u:User {userId: $user_id}), (a:Artist {artistId: $artist_id})
+        MATCH (u:User) WHERE u.userId = $user_id OR u.legacyId = $user_id
+        MATCH (a:Artist) WHERE a.artistId = $artist_id OR a.legacyId = $artist_id
+        OPTIONAL MATCH (u)-[existing:IS_A_FAN_OF]->(a)
+        WITH u, a, existing IS NULL as is_new
         MERGE (u)-[:IS_A_FAN_OF]->(a)
+
+        // Poslechy nového fanouška se přičtou k afinitě umělce
+        WITH u, a, is_new
+        WHERE is_new
+        MATCH (u)-[:LISTENED_TO]->(:Track)-[:IS_PERFORMED_BY]->(other:Artist)
+        WHERE other <> a
+        WITH a, other, count(*) as delta
+        MERGE (a)-[r:AFFINE_TO]->(other)
+        ON CREATE SET r.strength = delta
+        ON MATCH SET r.strength = r.strength + delta
         """
         self.conn.query(query, {"user_id": user_id, "artist_id": artist_id})
+        if self._cached_user(user_id):
+            self.local_cache.set_fan(user_id, artist_id, True)
+
+    def get_fan_community_stats(self, artist_id, user_id=None):
+        """Získá statistiky o fanouškovské skupině daného umělce
+        (včetně členství uživatele, pokud je zadán)"""
+        return self.conn.query(*self._fan_community_query(artist_id, user_id))
+
+    @staticmethod
+    def _fan_community_query(artist_id, user_id):
+        query = """
+        MATCH (a:Artist) WHERE a.artistId = $artist_id OR a.legacyId = $artist_id
+
+        // Ukázka jmen fanoušků (o jedno víc, aby šlo poznat "a další...")
+        CALL {
+            WITH a
+            MATCH (fan:User)-[:IS_A_FAN_OF]->(a)
+            WITH fan LIMIT 6
+            RETURN collect(fan.name) as fan_names
+        }
+
+        // Co tato komunita poslouchá JINÉHO - předpočítané hrany AFFINE_TO
+        CALL {
+            WITH a
+            MATCH (a)-[r:AFFINE_TO]->(other_artist:Artist)
+            WHERE r.strength > 0
+            WITH other_artist, r.strength as strength
+            ORDER BY strength DESC
+            LIMIT 5
+            RETURN collect({artist: other_artist.name, affinity: strength}) as related_tastes
+        }
+
+        // Uživatel se najde indexem, členství je pak jediná kontrola hrany
+        // (ne průchod všemi fanoušky umělce)
+        OPTIONAL MATCH (u:User) WHERE u.userId = $user_id OR u.legacyId = $user_id
+
+        RETURN COUNT { (a)<-[:IS_A_FAN_OF]-() } as total_fans, fan_names, related_tastes,
+               CASE WHEN u IS NULL THEN false
+                    ELSE EXISTS { (u)-[:IS_A_FAN_OF]->(a) } END as is_member
+        """
+        return query, {"artist_id": artist_id, "user_id": user_id}
+
+    # Omezení unikátnosti identifikátorů: (label, vlastnost, název dřívějšího indexu)
+    UNIQUE_IDS = (("Artist", "artistId", "artist_id"),
+                  ("Track", "trackId", "track_id"),
+                  ("User", "userId", "user_id"))
+
+    def ensure_indexes(self):
+        """Indexy na identifikátorech, ze kterých vycházejí všechny dotazy"""
+        for label, prop, index_name in self.UNIQUE_IDS:
+            self._ensure_unique(label, prop, index_name)
+        # Původní hex ID uzlů převedených přes IdMigration
+        self.conn.query("CREATE INDEX artist_legacy_id IF NOT EXISTS FOR (a:Artist) ON (a.legacyId)")
+        self.conn.query("CREATE INDEX track_legacy_id IF NOT EXISTS FOR (t:Track) ON (t.legacyId)")
+        self.conn.query("CREATE INDEX user_legacy_id IF NOT EXISTS FOR (u:User) ON (u.legacyId)")
+
+    def _ensure_unique(self, label, prop, index_name):
+        """Omezení unikátnosti ID (slouží zároveň jako index). Kontrola kolizí v dotazech
+        je čtení před zápisem - souběžný zápis stejného ID zastaví až omezení."""
+        constraint = f"{index_name}_unique"
+        if self.conn.query("SHOW CONSTRAINTS YIELD name WHERE name = $name RETURN name",
+                           {"name": constraint}):
+            return
+
+        duplicates = self.conn.query(f"""
+        MATCH (n:{label}) WHERE n.{prop} IS NOT NULL
+        WITH n.{prop} as id, count(*) as nodes
+        WHERE nodes > 1
+        RETURN count(*) as duplicates
+        """)[0]['duplicates']
+        if duplicates:
+            # Starší duplicity - zůstane obyčejný index, než se uzly sloučí
+            print(f"Nelze vytvořit omezení unikátnosti {label}.{prop}: {duplicates} duplicitních ID")
+            self.conn.query(f"CREATE INDEX {index_name} IF NOT EXISTS FOR (n:{label}) ON (n.{prop})")
+            return
 
-    def get_fan_community_stats(self, artist_id):
-        """Získá statistiky o fanouškovské skupině daného umělce"""
+        # Omezení nelze vytvořit vedle indexu na stejné vlastnosti
+        self.conn.query(f"DROP INDEX {index_name} IF EXISTS")
+        self.conn.query(f"CREATE CONSTRAINT {constraint} IF NOT EXISTS "
+                        f"FOR (n:{label}) REQUIRE n.{prop} IS UNIQUE")
+
+    def ensure_artist_affinity(self):
+        """Jednorázově přepočítá hrany AFFINE_TO, pokud v databázi nejsou v aktuální verzi"""
         query = """
-        MATCH (a:Artist {artistId: $artist_id})
-
-        // Zjistit počet fanoušků
-        OPTIONAL MATCH (fan:User)-[:IS_A_FAN_OF]->(a)
-        WITH a, count(fan) as total_fans, collect(fan.name) as fan_names
-
-        // Zjistit, co tato komunita poslouchá JINÉHO (nejčastěji)
-        // Najdi fanoušky -> jejich poslechy -> jiné umělce
-        OPTIONAL MATCH (community_member:User)-[:IS_A_FAN_OF]->(a)
-        MATCH (community_member)-[:LISTENED_TO]->(:Track)-[:IS_PERFORMED_BY]->(other_artist:Artist)
-        WHERE other_artist <> a
-        WITH a, total_fans, fan_names, other_artist, count(*) as strength
-        ORDER BY strength DESC
-        LIMIT 5
-
-        RETURN total_fans, fan_names, 
-               collect({artist: other_artist.name, affinity: strength}) as related_tastes
+        OPTIONAL MATCH (m:Maintenance {name: 'artistAffinity'})
+        RETURN m.version as version
         """
-        return self.conn.query(query, {"artist_id": artist_id})
+        if self.conn.query(query)[0]['version'] != self.AFFINITY_VERSION:
+            self.rebuild_artist_affinity()
+
+    def rebuild_artist_affinity(self):
+        """Přepočítá matici afinit umělců z poslechů fanoušků (po dávkách)
+        a zapíše značku verze"""
+        self.conn.query("""
+        MATCH ()-[r:AFFINE_TO]->()
+        CALL { WITH r DELETE r } IN TRANSACTIONS OF 10000 ROWS
+        """)
+        self.conn.query("""
+        MATCH (a:Artist)
+        CALL {
+            WITH a
+            MATCH (a)<-[:IS_A_FAN_OF]-(:User)-[:LISTENED_TO]->(:Track)-[:IS_PERFORMED_BY]->(other:Artist)
+            WHERE other <> a
+            WITH a, other, count(*) as strength
+            MERGE (a)-[r:AFFINE_TO]->(other)
+            SET r.strength = strength
+        } IN TRANSACTIONS OF 100 ROWS
+        """)
+        self.conn.query("""
+        MERGE (m:Maintenance {name: 'artistAffinity'})
+        SET m.version = $version, m.rebuiltAt = timestamp()
+        """, {"version": self.AFFINITY_VERSION})
 
     def get_user_fan_status(self, user_id, artist_id):
         """Zjistí, zda je uživatel členem skupiny"""
+        if self._cached_user(user_id):
+            return self.local_cache.is_fan(user_id, artist_id)
+        result = self.conn.query(*self._fan_status_query(user_id, artist_id))
+        return result[0]['is_member'] if result else False
+
+    @staticmethod
+    def _fan_status_query(user_id, artist_id):
         query = """
-        MATCH (u:User {userId: $user_id}), (a:Artist {artistId: $artist_id})
+        MATCH (u:User) WHERE u.userId = $user_id OR u.legacyId = $user_id
+        MATCH (a:Artist) WHERE a.artistId = $artist_id OR a.legacyId = $artist_id
         RETURN EXISTS((u)-[:IS_A_FAN_OF]->(a)) as is_member
         """
-        result = self.conn.query(query, {"user_id": user_id, "artist_id": artist_id})
+        return query, {"user_id": user_id, "artist_id": artist_id}
+
+    def start_track(self, user_id, artist_id, previous_listen=None):
+        """Při přepnutí skladby zaznamená poslech té předchozí a zjistí stav
+        fanouška nového umělce v jedné transakci"""
+        if self._cached_user(user_id):
+            # Stav fanouška je v lokální cache, do databáze jde jen zápis poslechu
+            if previous_listen:
+                self.record_listen(user_id, *previous_listen)
+            return self.local_cache.is_fan(user_id, artist_id)
+
+        queries = []
+        if previous_listen:
+            queries.append(("listen", *self._record_listen_query(user_id, *previous_listen)))
+        queries.append(("fan_status", *self._fan_status_query(user_id, artist_id)))
+
+        result = self.conn.query_batch(queries)["fan_status"]
+        if previous_listen:
+            track_id, _, listen_date = previous_listen
+            self._record_popularity(user_id, track_id, listen_date)
         return result[0]['is_member'] if result else False
 
     def remove_fan_relationship(self, user_id, artist_id):
         """Odebrání vazby IS_A_FAN_OF"""
         query = """
-        MATCH (u:User {userId: $user_id})-[r:IS_A_FAN_OF]->(a:Artist {artistId: $artist_id})
+        MATCH (u:User) WHERE u.userId = $user_id OR u.legacyId = $user_id
+        MATCH (a:Artist) WHERE a.artistId = $artist_id OR a.legacyId = $artist_id
+        MATCH (u)-[f:IS_A_FAN_OF]->(a)
+        DELETE f
+
+        // Poslechy bývalého fanouška se od afinity umělce odečtou
+        WITH u, a
+        MATCH (u)-[:LISTENED_TO]->(:Track)-[:IS_PERFORMED_BY]->(other:Artist)
+        WHERE other <> a
+        WITH a, other, count(*) as delta
+        MATCH (a)-[r:AFFINE_TO]->(other)
+        SET r.strength = r.strength - delta
+        WITH r
+        WHERE r.strength <= 0
         DELETE r
         """
         self.conn.query(query, {"user_id": user_id, "artist_id": artist_id})
+        if self._cached_user(user_id):
+            self.local_cache.set_fan(user_id, artist_id, False)
+
+
+class AsyncMusicRecommender:
+    """Asynchronní varianta MusicRecommender - stejné dotazy, souběžné spouštění"""
+
+    ALGORITHMS = ("collaborative", "content", "hybrid")
+
+    def __init__(self, async_conn):
+        self.conn = async_conn
+
+    async def collaborative_filtering(self, user_id, limit=10):
+        return await self.conn.query(*MusicRecommender._collaborative_query(user_id, limit))
+
+    async def content_based_filtering(self, user_id, limit=10):
+        return await self.conn.query(*MusicRecommender._content_query(user_id, limit))
+
+    async def hybrid_recommendation(self, user_id, limit=10, alpha=0.6):
+        return await self.conn.query(*MusicRecommender._hybrid_query(user_id, limit, alpha))
+
+    async def record_listen(self, user_id, track_id, listen_duration, listen_date):
+        await self.conn.query(*MusicRecommender._record_listen_query(
+            user_id, track_id, listen_duration, listen_date))
+
+    async def get_fan_community_stats(self, artist_id, user_id=None):
+        return await self.conn.query(*MusicRecommender._fan_community_query(artist_id, user_id))
+
+    async def get_user_fan_status(self, user_id, artist_id):
+        result = await self.conn.query(*MusicRecommender._fan_status_query(user_id, artist_id))
+        return result[0]['is_member'] if result else False
+
+    async def compare_all(self, user_id, artist_id=None, limit=10, alpha=0.6):
+        """Spustí všechna doporučení (a případně Fan Zone) souběžně a sloučí výsledky"""
+        tasks = {
+            "collaborative": self.collaborative_filtering(user_id, limit),
+            "content": self.content_based_filtering(user_id, limit),
+            "hybrid": self.hybrid_recommendation(user_id, limit, alpha),
+        }
+        if artist_id:
+            tasks["is_fan"] = self.get_user_fan_status(user_id, artist_id)
+            tasks["fan_community"] = self.get_fan_community_stats(artist_id, user_id)
+
+        import asyncio  # v běžící korutině je už načtené, modul ho při startu nepotřebuje
+        results = dict(zip(tasks, await asyncio.gather(*tasks.values())))
+        if "fan_community" in results:
+            rows = results["fan_community"]
+            results["fan_community"] = rows[0] if rows else None
+        results["merged"] = self.merge_recommendations(results)
+        return results
+
+    @classmethod
+    def merge_recommendations(cls, results):
+        """Sloučí seznamy doporučení: napřed skladby, na kterých se shodne více algoritmů,
+        pak podle nejlepšího pořadí v některém z nich"""
+        merged = {}
+        for algorithm in cls.ALGORITHMS:
+            for rank, rec in enumerate(results.get(algorithm) or []):
+                entry = merged.setdefault(rec['trackId'], {
+                    "trackId": rec['trackId'], "title": rec['title'], "artist": rec['artist'],
+                    "genre": rec.get('genre'), "filePath": rec.get('filePath'), "ranks": {},
+                })
+                entry["ranks"][algorithm] = rank + 1
+        return sorted(merged.values(),
+                      key=lambda e: (-len(e["ranks"]), min(e["ranks"].values()), e["title"] or ""))
+
+
+class RadioSession:
+    """Nekonečný proud doporučení ("rádio") pro jednoho uživatele.
+
+    Kandidáti se seřadí jedním dotazem do většího poolu a stránky se z něj jen odebírají.
+    Když pool klesne pod low_water, doplní se ve sdíleném executoru další dávkou, která
+    vynechá naposledy vydané, přehrané i čekající skladby (nejvýš max_seen - dávno
+    vydaná skladba se tak v nekonečném rádiu může po čase vrátit). Když zvolený
+    algoritmus nic nového nevrátí, rádio pokračuje nejposlouchanějšími skladbami."""
+
+    SOURCES = ("collaborative", "content", "hybrid", "popular")
+
+    def __init__(self, recommender, user_id, executor, algorithm="hybrid", alpha=0.6,
+                 pool_size=100, low_water=20, max_seen=1000):
+        self.recommender = recommender
+        self.user_id = user_id
+        self.executor = executor    # sdílený s ostatní prací na pozadí, session nemá vlastní vlákno
+        self.alpha = alpha
+        self.pool_size = pool_size
+        self.low_water = low_water
+        self.max_seen = max_seen    # musí být výrazně víc než pool_size
+        self.cursor = 0             # počet už vydaných skladeb
+        self.exhausted = False      # žádný zdroj už nemá nové kandidáty
+        self.closed = False
+        self.last_used = time.monotonic()
+
+        self._sources = [algorithm] if algorithm == "popular" else [algorithm, "popular"]
+        self._pool = deque()
+        self._seen = {}             # trackId -> None, v pořadí vydání (omezená množina)
+        self._lock = threading.Lock()
+        self._refill = None         # Future právě běžícího doplňování
+
+    def try_next_page(self, size=10):
+        """Neblokující: vrátí (stránka, None), nebo (None, Future doplňování), po jehož
+        dokončení je třeba zavolat znovu. Stránka je {"cursor", "tracks", "exhausted"}."""
+        with self._lock:
+            self.last_used = time.monotonic()
+            if len(self._pool) < size and not self.exhausted:
+                return None, self._start_refill()
+
+            tracks = [self._pool.popleft() for _ in range(min(size, len(self._pool)))]
+            self.cursor += len(tracks)
+            if len(self._pool) < self.low_water and not self.exhausted:
+                self._start_refill()
+            return {"cursor": self.cursor, "tracks": tracks,
+                    "exhausted": self.exhausted and not self._pool}, None
+
+    def next_page(self, size=10):
+        """Blokující varianta try_next_page - nesmí běžet ve vlákně executoru rádia"""
+        while True:
+            page, refill = self.try_next_page(size)
+            if page is not None:
+                return page
+            refill.result()
+
+    def mark_played(self, track_id):
+        """Skladba přehraná mimo rádio se už nabízet nebude"""
+        with self._lock:
+            self._remember(track_id)
+            for track in self._pool:
+                if track["trackId"] == track_id:
+                    self._pool.remove(track)
+                    break
+
+    def close(self):
+        """Ukončí rádio - doplňování, které ještě čeká v executoru, nic nenačte"""
+        with self._lock:
+            self.closed = True
+            self.exhausted = True
+            self._pool.clear()
+
+    def _remember(self, track_id):
+        """Přidá skladbu do omezené množiny vynechávaných (volá se pod zámkem)"""
+        self._seen.pop(track_id, None)
+        self._seen[track_id] = None
+        if len(self._seen) > self.max_seen:
+            del self._seen[next(iter(self._seen))]
+
+    def _start_refill(self):
+        """Spustí doplnění poolu, pokud už neběží (volá se pod zámkem)"""
+        if self._refill is None or self._refill.done():
+            self._refill = self.executor.submit(self._fill)
+        return self._refill
+
+    def _fill(self):
+        with self._lock:
+            if self.closed:
+                return
+            exclude = list(self._seen)
+
+        while self._sources:
+            rows = self._fetch(self._sources[0], exclude)
+            with self._lock:
+                fresh = [row for row in rows if row["trackId"] not in self._seen]
+                for row in fresh:
+                    self._remember(row["trackId"])
+                    self._pool.append(row)
+            if fresh:
+                return
+            # Zdroj je vyčerpán, pokračuje se dalším
+            self._sources.pop(0)
+
+        with self._lock:
+            self.exhausted = True
+
+    def _fetch(self, source, exclude):
+        if source == "collaborative":
+            return self.recommender.collaborative_filtering(self.user_id, self.pool_size, exclude)
+        if source == "content":
+            return self.recommender.content_based_filtering(self.user_id, self.pool_size, exclude)
+        if source == "hybrid":
+            return self.recommender.hybrid_recommendation(self.user_id, self.pool_size,
+                                                          self.alpha, exclude)
+        return self.recommender.popular_tracks(self.pool_size, exclude)
 
 
 # === 5. HUDEBNÍ PŘEHRÁVAČ ===
 class MusicPlayer:
     def __init__(self, recommender):
-        pygame.mixer.init()
+        self._mixer_ready = False  # mixer se inicializuje až při prvním přehrání
         self.recommender = recommender
         self.current_track_id = None
         self.current_artist_id = None
         self.is_playing = False
         self.current_user_id = None
         self.play_start_time = None
+        self.current_is_fan = False
 
     def play(self, file_path, track_id, artist_id):
         """Přehrání skladby"""
         try:
-            if self.current_track_id and self.play_start_time:
-                self._record_listen_time()
-
-            pygame.mixer.music.load(file_path)
-            pygame.mixer.music.play()
+            # Poslech předchozí skladby a stav fanouška v jedné transakci - ještě před
+            # přepnutím, chyba databáze tak nechá hrát předchozí skladbu a poslech nezahodí
+            previous_listen = self._pending_listen()
+            is_fan = False
+            if self.current_user_id and artist_id:
+                is_fan = self.recommender.start_track(self.current_user_id, artist_id, previous_listen)
+            elif previous_listen and self.current_user_id:
+                self.recommender.record_listen(self.current_user_id, *previous_listen)
+            if previous_listen:
+                self.play_start_time = None  # poslech je uložen, nezapočítá se znovu
+
+            self._music().load(file_path)
+            self._music().play()
             self.is_playing = True
             self.current_track_id = track_id
             self.current_artist_id = artist_id
             self.play_start_time = time.time()
+            self.current_is_fan = is_fan
 
             return True, "Přehrává se"
         except Exception as e:
             return False, f"Chyba: {e}"
 
+    def _music(self):
+        """Vrátí pygame.mixer.music, mixer inicializuje při prvním použití"""
+        pygame = lazy_import("pygame")
+        if not self._mixer_ready:
+            with startup_profiler.measure("pygame.mixer.init"):
+                pygame.mixer.init()
+            self._mixer_ready = True
+        return pygame.mixer.music
+
     def pause(self):
         if self.is_playing:
-            pygame.mixer.music.pause()
+            self._music().pause()
             self.is_playing = False
             return "Pozastaveno"
         else:
-            pygame.mixer.music.unpause()
+            if self._mixer_ready:
+                self._music().unpause()
             self.is_playing = True
             return "Pokračuje"
 
@@ -371,7 +2540,8 @@ class MusicPlayer:
         if self.current_track_id and self.play_start_time:
             self._record_listen_time()
 
-        pygame.mixer.music.stop()
+        if self._mixer_ready:
+            self._music().stop()
         self.is_playing = False
         self.current_track_id = None
         self.current_artist_id = None
@@ -380,30 +2550,45 @@ class MusicPlayer:
 
     def _record_listen_time(self):
         """Zaznamenání času poslechu"""
-        if not self.current_user_id or not self.current_track_id:
+        if not self.current_user_id:
             return
 
+        listen = self._pending_listen()
+        if listen:
+            self.recommender.record_listen(self.current_user_id, *listen)
+
+    def _pending_listen(self):
+        """Vrátí (track_id, délka, datum) aktuálního poslechu, pokud se má zaznamenat"""
+        if not self.current_track_id or not self.play_start_time:
+            return None
+
         listen_duration = int(time.time() - self.play_start_time)
 
         if listen_duration >= 10:
             listen_date = datetime.now().isoformat()
-            self.recommender.record_listen(
-                self.current_user_id,
-                self.current_track_id,
-                listen_duration,
-                listen_date
-            )
+            return self.current_track_id, listen_duration, listen_date
+        return None
 
     def add_artist_to_favorites(self):
         """Přidání umělce do oblíbených"""
         if self.current_user_id and self.current_artist_id:
             self.recommender.add_fan_relationship(self.current_user_id, self.current_artist_id)
+            self.current_is_fan = True
             return True, "Umělec přidán do oblíbených"
         return False, "Žádný umělec není načten"
 
 
 # === 6. TKINTER APLIKACE ===
 class MusicPlayerApp:
+    PROGRESS_POLL_MS = 200  # jak často Tk smyčka vybírá frontu průběhu skenování
+    SEARCH_DELAY_MS = 250   # vyhledávání až po pauze v psaní, ne po každém stisku
+    RADIO_PAGE_SIZE = 10
+    RADIO_ALGORITHMS = {
+        "Kolaborativní filtrování": "collaborative",
+        "Obsahové filtrování": "content",
+        "Hybridní doporučení": "hybrid",
+    }
+
     def __init__(self, root):
         self.root = root
         self.root.title("🎵 Hudební přehrávač s Neo4j")
@@ -416,14 +2601,32 @@ class MusicPlayerApp:
         self.scanner = None
         self.recommender = None
         self.player = None
+        self.artwork_store = None
+        self.local_cache = None
         self.current_user = None
         self.music_dir = None
+        self.watch_library = False
+        self.library_watcher = None
+        self.catalogue = TrackCatalogue()
+        self.library_view = self.catalogue.view()
+        self.tracks_data = self.library_view
+        self.track_listbox = None
+        self._search_job = None  # naplánované vyhledávání (root.after)
+
+        # Rádio - fronta doporučení, která se doplňuje po stránkách
+        self.radio = None
+        self.radio_queue = []
+        self.radio_loading = False
+        self.radio_exhausted = False
 
         # Progress bar
         self.current_track_duration = 0
         self.current_time_played = 0
         self.timer_loop_id = None  # Pro zrušení smyčky při stopce
 
+        # Vlákna pro práci na pozadí (připojení, načítání knihoven)
+        self.background = ThreadPoolExecutor(max_workers=2, thread_name_prefix="background")
+
         # Zobrazení připojovací obrazovky
         self.show_connection_screen()
 
@@ -455,31 +2658,75 @@ class MusicPlayerApp:
         pass_entry = tk.Entry(frame, width=40, show="*")
         pass_entry.pack(pady=5)
 
+        status_var = tk.StringVar(value="")
+
         def connect():
+            # Připojení běží na pozadí, okno mezitím zůstává responzivní
+            connect_btn.config(state=tk.DISABLED)
+            status_var.set("Připojování...")
+            future = self.background.submit(self._open_connection, uri_entry.get(),
+                                            user_entry.get(), pass_entry.get())
+            self.root.after(50, wait_for_connection, future)
+
+        def wait_for_connection(future):
+            if not future.done():
+                self.root.after(50, wait_for_connection, future)
+                return
             try:
-                connection = Neo4jConnection(
-                    uri_entry.get(),
-                    user_entry.get(),
-                    pass_entry.get()
-                )
+                future.result()
+            except Exception as e:
+                status_var.set("")
+                connect_btn.config(state=tk.NORMAL)
+                messagebox.showerror("Chyba", f"Nepodařilo se připojit: {e}")
+                return
 
-                connection.verify_connection()
+            messagebox.showinfo("Úspěch", "Připojení k Neo4j úspěšné!")
+            self.show_login_screen()
 
-                self.neo4j_conn = connection
-                self.user_manager = UserManager(self.neo4j_conn)
-                self.scanner = MusicLibraryScanner(self.neo4j_conn)
-                self.recommender = MusicRecommender(self.neo4j_conn)
-                self.player = MusicPlayer(self.recommender)
+        connect_btn = tk.Button(frame, text="Připojit", command=connect, bg="#4CAF50", fg="white",
+                                font=("Arial", 12), padx=20, pady=10)
+        connect_btn.pack(pady=20)
 
-                messagebox.showinfo("Úspěch", "Připojení k Neo4j úspěšné!")
-                self.show_login_screen()
-            except Exception as e:
-                if 'connection' in locals():
-                    connection.close()
-                messagebox.showerror("Chyba", f"Nepodařilo se připojit: {e}")
+        tk.Label(frame, textvariable=status_var, bg="#1e1e1e", fg="#aaaaaa").pack()
+
+        # Driver se načte na pozadí, zatímco uživatel vyplňuje přihlašovací údaje
+        self.background.submit(lazy_import, "neo4j")
 
-        tk.Button(frame, text="Připojit", command=connect, bg="#4CAF50", fg="white",
-                  font=("Arial", 12), padx=20, pady=10).pack(pady=20)
+    def _open_connection(self, uri, user, password):
+        """Vytvoří připojení a služby nad ním (běží ve vlákně na pozadí)"""
+        with startup_profiler.measure("neo4j connect"):
+            connection = Neo4jConnection(uri, user, password)
+            try:
+                connection.verify_connection()
+            except Exception:
+                connection.close()
+                raise
+
+        self.neo4j_conn = connection
+        self.local_cache = LocalLibraryCache.for_database(uri)
+        self.user_manager = UserManager(self.neo4j_conn)
+        self.artwork_store = ArtworkStore()
+        self.scanner = MusicLibraryScanner(self.neo4j_conn, self.artwork_store)
+        leaderboards = PopularityLeaderboards()
+        self.recommender = MusicRecommender(self.neo4j_conn, self.local_cache, leaderboards)
+        self.player = MusicPlayer(self.recommender)
+
+        self.recommender.ensure_indexes()
+        # Jednorázová údržba může trvat minuty - má vlastní vlákno, aby nedržela
+        # pool self.background, na který čeká načítání a synchronizace v UI
+        threading.Thread(target=self._run_maintenance, args=(leaderboards,),
+                         daemon=True, name="maintenance").start()
+
+    def _run_maintenance(self, leaderboards):
+        """Naplní žebříčky popularity a podle potřeby přepočítá afinity umělců"""
+        try:
+            leaderboards.bootstrap(self.neo4j_conn)
+        except Exception as e:
+            print(f"Nelze načíst žebříčky popularity: {e}")
+        try:
+            self.recommender.ensure_artist_affinity()
+        except Exception as e:
+            print(f"Přepočet afinit umělců selhal: {e}")
 
     def show_login_screen(self):
         """Přihlašovací obrazovka"""
@@ -505,6 +2752,7 @@ class MusicPlayerApp:
             if user_id:
                 self.current_user = {"userId": user_id, "name": username}
                 self.player.current_user_id = user_id
+                self.sync_user_state(user_id)
                 messagebox.showinfo("Úspěch", msg)
                 self.show_music_directory_screen()
             else:
@@ -520,6 +2768,7 @@ class MusicPlayerApp:
             if user_id:
                 self.current_user = {"userId": user_id, "name": username}
                 self.player.current_user_id = user_id
+                self.sync_user_state(user_id)
                 messagebox.showinfo("Úspěch", msg)
                 self.show_music_directory_screen()
             else:
@@ -533,6 +2782,14 @@ class MusicPlayerApp:
         tk.Button(btn_frame, text="📝 Registrovat", command=register, bg="#4CAF50",
                   fg="white", font=("Arial", 12), padx=20, pady=10).pack(side=tk.LEFT, padx=5)
 
+    def sync_user_state(self, user_id):
+        """Stáhne oblíbené umělce a poslechy uživatele do lokální cache"""
+        try:
+            self.local_cache.sync_user(self.neo4j_conn, user_id)
+        except Exception as e:
+            # Bez synchronizace se stav fanouška čte přímo z databáze
+            print(f"Nelze synchronizovat stav uživatele: {e}")
+
     def show_music_directory_screen(self):
         """Obrazovka pro výběr hudební složky"""
         self.clear_window()
@@ -546,16 +2803,32 @@ class MusicPlayerApp:
         tk.Label(frame, text="Vyber složku s hudbou", font=("Arial", 14),
                  bg="#1e1e1e", fg="#cccccc").pack(pady=20)
 
+        content_identity = tk.BooleanVar(
+            value=self.scanner.identity_mode == MusicLibraryScanner.IDENTITY_CONTENT)
+        watch_library = tk.BooleanVar(value=self.watch_library)
+
         def select_directory():
             directory = filedialog.askdirectory(title="Vyber složku s MP3 soubory")
             if directory:
                 self.music_dir = directory
+                self.scanner.identity_mode = (MusicLibraryScanner.IDENTITY_CONTENT
+                                              if content_identity.get()
+                                              else MusicLibraryScanner.IDENTITY_PATH)
+                self.watch_library = watch_library.get()
                 self.scan_music_library()
 
         tk.Button(frame, text="📁 Vybrat složku", command=select_directory,
                   bg="#FF9800", fg="white", font=("Arial", 14),
                   padx=30, pady=15).pack(pady=10)
 
+        tk.Checkbutton(frame, text="Identita skladeb podle obsahu (rozpozná přesunuté soubory)",
+                       variable=content_identity, bg="#1e1e1e", fg="#cccccc",
+                       selectcolor="#3d3d3d", activebackground="#1e1e1e").pack(pady=5)
+
+        tk.Checkbutton(frame, text="Průběžně sledovat změny ve složce",
+                       variable=watch_library, bg="#1e1e1e", fg="#cccccc",
+                       selectcolor="#3d3d3d", activebackground="#1e1e1e").pack(pady=5)
+
         tk.Label(frame, text="nebo", bg="#1e1e1e", fg="#888888").pack(pady=5)
 
         tk.Button(frame, text="▶ Pokračovat s existující knihovnou",
@@ -566,33 +2839,56 @@ class MusicPlayerApp:
         """Skenování hudební knihovny"""
         progress_window = tk.Toplevel(self.root)
         progress_window.title("Skenování")
-        progress_window.geometry("400x150")
+        progress_window.geometry("560x190")
         progress_window.configure(bg="#1e1e1e")
 
         tk.Label(progress_window, text="Skenování hudební knihovny...",
                  bg="#1e1e1e", fg="#ffffff", font=("Arial", 12)).pack(pady=20)
 
-        progress_var = tk.StringVar(value="0 / 0")
+        progress_var = tk.StringVar(value="Vyhledávání souborů...")
         progress_label = tk.Label(progress_window, textvariable=progress_var,
                                   bg="#1e1e1e", fg="#cccccc")
         progress_label.pack()
 
-        progress_bar = ttk.Progressbar(progress_window, length=300, mode='determinate')
+        progress_bar = ttk.Progressbar(progress_window, length=500, mode='determinate')
         progress_bar.pack(pady=20)
 
-        def update_progress(current, total):
-            progress_var.set(f"{current} / {total}")
-            progress_bar['maximum'] = total
-            progress_bar['value'] = current
-            progress_window.update()
+        error_var = tk.StringVar()
+        tk.Label(progress_window, textvariable=error_var,
+                 bg="#1e1e1e", fg="#f44336").pack()
+
+        # Skenovací vlákno jen plní frontu, widgety aktualizuje výhradně Tk smyčka
+        progress = ScanProgress()
+
+        def poll_progress():
+            event = progress.drain()
+            if event:
+                progress_var.set(ScanProgress.format(event))
+                progress_bar['maximum'] = max(event['total_bytes'], 1)
+                progress_bar['value'] = event['bytes_done']
+                if event['last_error']:
+                    error_var.set(f"Poslední chyba: {event['last_error']}")
+
+                if event['finished']:
+                    progress_window.destroy()
+                    if event['failed']:
+                        messagebox.showerror("Chyba", f"Skenování selhalo: {event['last_error']}")
+                    else:
+                        messagebox.showinfo("Dokončeno", f"Naskenováno {event['found']} skladeb "
+                                                         f"(chyb: {event['errors']})")
+                    self.show_player_screen()
+                    return
+            progress_window.after(self.PROGRESS_POLL_MS, poll_progress)
 
         def scan_thread():
-            count = self.scanner.scan_directory(self.music_dir, update_progress)
-            progress_window.destroy()
-            messagebox.showinfo("Dokončeno", f"Naskenováno {count} skladeb")
-            self.show_player_screen()
+            try:
+                self.scanner.scan_directory(self.music_dir, progress)
+            except Exception as e:
+                # Závěrečnou událost už odeslal scan_directory
+                print(f"Skenování selhalo: {e}")
 
         threading.Thread(target=scan_thread, daemon=True).start()
+        poll_progress()
 
     def show_player_screen(self):
         """Hlavní obrazovka přehrávače"""
@@ -629,7 +2925,8 @@ class MusicPlayerApp:
         now_playing_frame.pack(fill=tk.X, padx=5, pady=5)
 
         # Obrázek alba
-        default_img = Image.new('RGB', (150, 150), color='#1e1e1e')
+        Image, ImageTk = _pil()
+        default_img = Image.new('RGB', THUMBNAIL_SIZE, color='#1e1e1e')
         self.album_art_image = ImageTk.PhotoImage(default_img)
 
         self.art_label = tk.Label(now_playing_frame, image=self.album_art_image, bg="#252525")
@@ -690,6 +2987,14 @@ class MusicPlayerApp:
         tk.Label(left_frame, text="📚 Knihovna", font=("Arial", 10, "bold"),
                  bg="#2d2d2d", fg="#aaaaaa").pack(anchor="w", padx=5)
 
+        # Vyhledávání v lokálním katalogu
+        search_var = tk.StringVar()
+        search_entry = tk.Entry(left_frame, textvariable=search_var, bg="#3d3d3d", fg="#ffffff",
+                                insertbackground="#ffffff", bd=0)
+        search_entry.pack(fill=tk.X, padx=5, pady=(5, 0))
+        search_entry.bind("<KeyRelease>", lambda e: self.schedule_search())
+        self.search_var = search_var
+
         list_frame = tk.Frame(left_frame, bg="#2d2d2d")
         list_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
 
@@ -702,13 +3007,13 @@ class MusicPlayerApp:
         self.track_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.config(command=self.track_listbox.yview)
 
-        # Načtení skladeb
-        self.tracks_data = self.scanner.get_all_tracks()
-        for track in self.tracks_data:
-            display_text = f"{track['title']} - {track['artist']}"
-            # if track.get('genre'):
-            #     display_text += f" ({track['genre']})"
-            self.track_listbox.insert(tk.END, display_text)
+        # Načtení skladeb - okamžitě z lokální cache, změny z databáze dorazí na pozadí
+        self.catalogue = self.local_cache.load_catalogue()
+        self.library_view = self.catalogue.view()
+        self.tracks_data = self.library_view
+        self.fill_track_listbox()
+        self.background.submit(self.sync_catalogue)
+        self.start_library_watcher()
 
         # Status label
         self.status_label = tk.Label(left_frame, text="Připraveno",
@@ -734,6 +3039,8 @@ class MusicPlayerApp:
 
         tk.Button(rec_frame, text="🔍 Doporuč", command=self.get_recommendations,
                   bg="#9C27B0", fg="white").pack(side=tk.LEFT)
+        tk.Button(rec_frame, text="📻 Rádio", command=self.start_radio,
+                  bg="#E91E63", fg="white").pack(side=tk.LEFT, padx=5)
 
         # Seznam doporučení
         rec_list_frame = tk.Frame(right_frame, bg="#2d2d2d")
@@ -745,9 +3052,83 @@ class MusicPlayerApp:
         self.rec_listbox = tk.Listbox(rec_list_frame, yscrollcommand=rec_scrollbar.set,
                                       bg="#3d3d3d", fg="#ffffff", font=("Arial", 10))
         self.rec_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.rec_listbox.bind("<Double-Button-1>", lambda e: self.play_recommendation())
         rec_scrollbar.config(command=self.rec_listbox.yview)
 
-        self.recommendations_data = []
+        self.recommendations_data = TrackCatalogue().view()
+
+    def sync_catalogue(self):
+        """Přírůstková synchronizace lokální cache (běží ve vlákně na pozadí)"""
+        try:
+            changed = self.local_cache.sync_catalogue(self.neo4j_conn)
+        except Exception as e:
+            # Databáze je nedostupná - pokračujeme s lokální kopií
+            print(f"Synchronizace knihovny selhala: {e}")
+            return
+        if changed:
+            catalogue = self.local_cache.load_catalogue()
+            self.root.after(0, self.show_catalogue, catalogue)
+
+    def show_catalogue(self, catalogue):
+        """Zobrazí nově načtený katalog (volá se v Tk smyčce)"""
+        self.catalogue = catalogue
+        self.library_view = catalogue.view()
+        if self.track_listbox and self.track_listbox.winfo_exists():
+            self.search_tracks(self.search_var.get())
+
+    def schedule_search(self):
+        """Odloží vyhledávání do pauzy v psaní - každý filtr katalogu přestaví celý seznam"""
+        if self._search_job:
+            self.root.after_cancel(self._search_job)
+        self._search_job = self.root.after(self.SEARCH_DELAY_MS, self._run_search)
+
+    def _run_search(self):
+        self._search_job = None
+        if self.track_listbox and self.track_listbox.winfo_exists():
+            self.search_tracks(self.search_var.get())
+
+    def search_tracks(self, text):
+        """Filtruje seznam skladeb podle názvu nebo umělce"""
+        text = text.strip()
+        self.tracks_data = self.library_view.filter(text) if text else self.library_view
+        self.fill_track_listbox()
+
+    def fill_track_listbox(self):
+        """Naplní seznam skladeb z self.tracks_data"""
+        self.track_listbox.delete(0, tk.END)
+        # Jediné volání Tcl pro celý seznam (po položkách by to u velkých knihoven trvalo sekundy)
+        self.track_listbox.insert(tk.END, *[self.tracks_data.display_text(i)
+                                            for i in range(len(self.tracks_data))])
+
+    def start_library_watcher(self):
+        """Spustí sledování hudební složky, pokud je zapnuté"""
+        if not self.watch_library or not self.music_dir:
+            return
+        if self.library_watcher and self.library_watcher.directory == str(Path(self.music_dir)):
+            return
+
+        self.stop_library_watcher()
+        self.library_watcher = LibraryWatcher(
+            self.scanner, self.music_dir,
+            on_change=lambda summary: self.root.after(0, self.apply_library_changes, summary)
+        )
+        self.library_watcher.start()
+
+    def stop_library_watcher(self):
+        if self.library_watcher:
+            self.library_watcher.stop()
+            self.library_watcher = None
+
+    def apply_library_changes(self, summary):
+        """Promítne změny ze sledování složky do seznamu skladeb (volá se v Tk smyčce)"""
+        self.catalogue.remove_paths(set(summary['deleted']))
+        self.catalogue.move_paths(summary['moved'])
+        for track in summary['tracks']:
+            self.catalogue.append(track)
+        self.library_view = self.catalogue.view().sorted("title")
+
+        if self.track_listbox and self.track_listbox.winfo_exists():
+            self.search_tracks(self.search_var.get())
 
     def update_progress_loop(self):
         """Aktualizuje progress bar každou vteřinu"""
@@ -762,6 +3143,11 @@ class MusicPlayerApp:
                 self.progress_bar['value'] = self.current_time_played
                 self.lbl_current_time.config(text=self.format_time(self.current_time_played))
 
+            # Rádio po dohrání skladby pokračuje další z fronty
+            elif self.radio and self.radio_queue:
+                self.play_radio_track(0)
+                return
+
         # Naplánování dalšího spuštění za 1000 ms (1 sekunda)
         self.timer_loop_id = self.root.after(1000, self.update_progress_loop)
 
@@ -777,8 +3163,13 @@ class MusicPlayerApp:
             messagebox.showwarning("Upozornění", "Vyber skladbu")
             return
 
-        idx = selection[0]
-        track = self.tracks_data[idx]
+        self.play_track(self.tracks_data[selection[0]])
+
+    def play_track(self, track):
+        """Přehraje skladbu (slovník ve tvaru get_all_tracks) a aktualizuje přehrávač"""
+        # Skladbu přehranou mimo frontu už rádio nenabídne
+        if self.radio:
+            self.radio.mark_played(track['trackId'])
 
         # Resetování předchozí smyčky, pokud běží
         if self.timer_loop_id:
@@ -792,20 +3183,16 @@ class MusicPlayerApp:
             self.lbl_artist.config(text=track['artist'])
 
             # Načtení a aktualizace obrázku alba
-            new_art = self.get_album_art(track['filePath'])
+            new_art = self.get_album_art(track.get('artHash'))
             self.art_label.configure(image=new_art)
             self.art_label.image = new_art  # DŮLEŽITÉ: Udržet referenci, jinak zmizí!
 
-            # Aktualizace tlačítka oblíbených (z předchozího kroku)
+            # Aktualizace tlačítka oblíbených (stav zjistil přehrávač při spuštění)
             if self.current_user:
-                is_fan = self.recommender.get_user_fan_status(
-                    self.current_user['userId'],
-                    track['artistId']
-                )
-                self.update_favorite_button_visuals(is_fan)
+                self.update_favorite_button_visuals(self.player.current_is_fan)
 
             # Nastavení progress baru
-            self.current_track_duration = track['duration']
+            self.current_track_duration = track['duration'] or 0
             self.current_time_played = 0
 
             self.progress_bar['maximum'] = self.current_track_duration
@@ -848,17 +3235,17 @@ class MusicPlayerApp:
         user_id = self.current_user['userId']
         artist_id = self.player.current_artist_id
 
-        # Zjistit aktuální stav
-        is_fan = self.recommender.get_user_fan_status(user_id, artist_id)
-
-        if is_fan:
+        # Aktuální stav známe z přehrávače, zápisy jsou idempotentní
+        if self.player.current_is_fan:
             # Pokud je fanoušek -> Odebrat
             self.recommender.remove_fan_relationship(user_id, artist_id)
+            self.player.current_is_fan = False
             self.update_favorite_button_visuals(False)  # Změnit vzhled na "Nejsem fanoušek"
             messagebox.showinfo("Info", "Umělec odebrán z oblíbených.")
         else:
             # Pokud není fanoušek -> Přidat
             self.recommender.add_fan_relationship(user_id, artist_id)
+            self.player.current_is_fan = True
             self.update_favorite_button_visuals(True)  # Změnit vzhled na "Jsem fanoušek"
             messagebox.showinfo("Info", "Umělec přidán do oblíbených!")
 
@@ -871,6 +3258,7 @@ class MusicPlayerApp:
 
     def get_recommendations(self):
         """Získání doporučení"""
+        self.stop_radio()
         self.rec_listbox.delete(0, tk.END)
         self.rec_listbox.insert(tk.END, "🔍 Načítám doporučení...")
         self.root.update()
@@ -886,20 +3274,104 @@ class MusicPlayerApp:
                 recs = self.recommender.hybrid_recommendation(self.current_user['userId'])
 
             self.rec_listbox.delete(0, tk.END)
-            self.recommendations_data = recs
+            self.recommendations_data = TrackCatalogue(recs).view()
 
             if recs:
-                for rec in recs:
-                    display_text = f"{rec['title']} - {rec['artist']}"
-                    # if rec.get('genre'):
-                    #     display_text += f" ({rec['genre']})"
-                    self.rec_listbox.insert(tk.END, display_text)
+                for i in range(len(self.recommendations_data)):
+                    self.rec_listbox.insert(tk.END, self.recommendations_data.display_text(i))
             else:
                 self.rec_listbox.insert(tk.END, "Zatím nemám dostatek dat pro doporučení")
         except Exception as e:
             self.rec_listbox.delete(0, tk.END)
             self.rec_listbox.insert(tk.END, f"Chyba: {e}")
 
+    def play_recommendation(self):
+        """Přehraje skladbu vybranou v seznamu doporučení (dvojklik)"""
+        selection = self.rec_listbox.curselection()
+        if not selection or selection[0] >= len(self.recommendations_data):
+            return
+        if self.radio:
+            self.play_radio_track(selection[0])
+        else:
+            self.play_track(self.recommendations_data[selection[0]])
+
+    def start_radio(self):
+        """Spustí rádio podle zvoleného algoritmu - fronta se sama doplňuje"""
+        self.stop_radio()
+        self.radio = RadioSession(self.recommender, self.current_user['userId'], self.background,
+                                  self.RADIO_ALGORITHMS[self.rec_type.get()])
+        if self.player.current_track_id:
+            self.radio.mark_played(self.player.current_track_id)
+
+        self.rec_listbox.delete(0, tk.END)
+        self.rec_listbox.insert(tk.END, "📻 Ladím rádio...")
+        self.fetch_radio_page(play_first=not self.player.is_playing)
+
+    def stop_radio(self):
+        if self.radio:
+            self.radio.close()
+        self.radio = None
+        self.radio_queue = []
+        self.radio_loading = False
+        self.radio_exhausted = False
+
+    def fetch_radio_page(self, play_first=False):
+        """Vezme další stránku rádia; když se pool teprve doplňuje, počká na něj
+        bez blokování Tk smyčky i vláken na pozadí"""
+        if self.radio_loading or self.radio_exhausted:
+            return
+        self.radio_loading = True
+        self.poll_radio_page(self.radio, play_first)
+
+    def poll_radio_page(self, radio, play_first):
+        if radio is not self.radio:
+            return  # mezitím bylo rádio vypnuto nebo přeladěno
+        page, refill = radio.try_next_page(self.RADIO_PAGE_SIZE)
+        if page is not None:
+            self.show_radio_page(radio, page, None, play_first)
+            return
+
+        def refilled(future):
+            if future.exception():
+                self.root.after(0, self.show_radio_page, radio, None, future.exception(), play_first)
+            else:
+                self.root.after(0, self.poll_radio_page, radio, play_first)
+
+        refill.add_done_callback(refilled)
+
+    def show_radio_page(self, radio, page, error, play_first):
+        """Připojí stránku rádia do fronty (volá se v Tk smyčce)"""
+        if radio is not self.radio or not self.rec_listbox.winfo_exists():
+            return  # mezitím bylo rádio vypnuto nebo přeladěno
+        self.radio_loading = False
+        if error:
+            self.rec_listbox.delete(0, tk.END)
+            self.rec_listbox.insert(tk.END, f"Chyba: {error}")
+            return
+
+        self.radio_queue.extend(page['tracks'])
+        self.radio_exhausted = page['exhausted']
+        if play_first and self.radio_queue:
+            self.play_radio_track(0)
+        else:
+            self.fill_radio_listbox()
+
+    def play_radio_track(self, index):
+        """Přehraje skladbu z fronty rádia a podle potřeby načte další stránku"""
+        track = self.radio_queue.pop(index)
+        self.play_track(track)
+        self.fill_radio_listbox()
+        if len(self.radio_queue) < self.RADIO_PAGE_SIZE // 2:
+            self.fetch_radio_page()
+
+    def fill_radio_listbox(self):
+        self.recommendations_data = TrackCatalogue(self.radio_queue).view()
+        self.rec_listbox.delete(0, tk.END)
+        for i in range(len(self.recommendations_data)):
+            self.rec_listbox.insert(tk.END, self.recommendations_data.display_text(i))
+        if self.radio_exhausted and not self.radio_queue:
+            self.rec_listbox.insert(tk.END, "📻 Rádio už nemá co nabídnout")
+
     def clear_window(self):
         """Vymazání všech widgetů z okna"""
         for widget in self.root.winfo_children():
@@ -910,6 +3382,7 @@ class MusicPlayerApp:
         # Zastavit aktuální přehrávání
         if self.player:
             self.player.stop()
+        self.stop_radio()
 
         # Vymazat aktuálního uživatele
         self.current_user = None
@@ -924,6 +3397,10 @@ class MusicPlayerApp:
         # Zastavit aktuální přehrávání
         if self.player:
             self.player.stop()
+        self.stop_radio()
+
+        # Zastavit sledování složky
+        self.stop_library_watcher()
 
         # Zavřít aktuální připojení
         if self.neo4j_conn:
@@ -932,7 +3409,11 @@ class MusicPlayerApp:
             except:
                 pass
 
+        if self.local_cache:
+            self.local_cache.close()
+
         # Vymazat všechna data
+        self.local_cache = None
         self.neo4j_conn = None
         self.user_manager = None
         self.scanner = None
@@ -957,9 +3438,8 @@ class MusicPlayerApp:
         fan_window.configure(bg="#2d2d2d")
 
         # Načtení dat
-        stats = self.recommender.get_fan_community_stats(self.player.current_artist_id)
-        is_member = self.recommender.get_user_fan_status(self.current_user['userId'],
-                                                         self.player.current_artist_id)
+        stats = self.recommender.get_fan_community_stats(self.player.current_artist_id,
+                                                         self.current_user['userId'])
 
         # Pokud nejsou data, ukončit
         if not stats:
@@ -967,6 +3447,7 @@ class MusicPlayerApp:
             return
 
         data = stats[0]  # První řádek výsledku
+        is_member = data['is_member']
 
         # --- UI Komponenty ---
 
@@ -1009,32 +3490,157 @@ class MusicPlayerApp:
             tk.Label(fan_window, text="Zatím málo dat pro analýzu.",
                      bg="#2d2d2d", fg="#aaaaaa").pack()
 
-    def get_album_art(self, file_path):
-        """Vytáhne obal alba z MP3, nebo vrátí defaultní obrázek"""
-        image = None
-        try:
-            audio = MP3(file_path, ID3=ID3)
-            if audio.tags:
-                for tag in audio.tags.values():
-                    if tag.FrameID == 'APIC':  # APIC je ID3 tag pro obrázek
-                        image_data = tag.data
-                        image = Image.open(io.BytesIO(image_data))
-                        break
-        except Exception as e:
-            print(f"Nelze načíst obal: {e}")
+    def get_album_art(self, art_hash):
+        """Vrátí předrenderovaný obal alba ze skenování, nebo defaultní obrázek"""
+        Image, ImageTk = _pil()
+        image = self.artwork_store.load(art_hash) if self.artwork_store else None
 
         # Pokud není obrázek, vytvoříme šedý čtverec (Placeholder)
         if image is None:
-            image = Image.new('RGB', (150, 150), color='#3d3d3d')
+            image = Image.new('RGB', THUMBNAIL_SIZE, color='#3d3d3d')
 
-        # Změna velikosti na 150x150 px (aby to nebylo moc velké)
-        image = image.resize((150, 150), Image.Resampling.LANCZOS)
         return ImageTk.PhotoImage(image)
 
 # === 7. SPUŠTĚNÍ APLIKACE ===
+def bulk_export(music_dir, output_dir, identity_mode):
+    """Offline export knihovny do CSV pro neo4j-admin"""
+    scanner = MusicLibraryScanner(None, identity_mode=identity_mode)
+    start = time.time()
+    manifest = scanner.export_bulk_import(music_dir, output_dir)
+
+    print(f"Exportováno za {time.time() - start:.1f} s: {manifest['counts']} (chyb: {manifest['errors']})")
+    print("\nPOZOR: import přepíše celou cílovou databázi - smaže i uživatele, jejich poslechy")
+    print("(LISTENED_TO) a fanoušky (IS_A_FAN_OF). Spouštějte ho jen nad prázdnou databází,")
+    print("do existující knihovny přidávejte skladby skenováním (--scan).")
+    print("\nZastavte databázi a spusťte import:\n")
+    print(MusicLibraryScanner.bulk_import_command(output_dir))
+    print("\nPo spuštění databáze ověřte import:\n")
+    print(f'python Neo4jMusicPlayer.py --verify-import "{output_dir}" --password <heslo>')
+
+
+def headless_scan(music_dir, uri, user, password, identity_mode):
+    """Skenování bez GUI, průběh se vypisuje ze stejného proudu událostí"""
+    conn = Neo4jConnection(uri, user, password)
+    try:
+        scanner = MusicLibraryScanner(conn, identity_mode=identity_mode)
+        scanner.ensure_indexes()
+        progress = ScanProgress(min_interval=1.0)
+        result = {}
+
+        def scan_thread():
+            try:
+                result["count"] = scanner.scan_directory(music_dir, progress)
+            except Exception as e:
+                result["error"] = e
+
+        worker = threading.Thread(target=scan_thread, daemon=True)
+        worker.start()
+        for event in progress.iter_events():
+            print(ScanProgress.format(event), flush=True)
+        worker.join()
+
+        if "error" in result:
+            print(f"Skenování selhalo: {result['error']}")
+            return False
+        print(f"Naskenováno {result['count']} skladeb")
+        return True
+    finally:
+        conn.close()
+
+
+def migrate_ids(uri, user, password, batch_size=1000):
+    """Převod starých hex ID na 64bitová (aplikace může během převodu běžet)"""
+    conn = Neo4jConnection(uri, user, password)
+    try:
+        MusicRecommender(conn).ensure_indexes()
+        migration = IdMigration(conn, batch_size)
+        results = migration.run(lambda label, done, collisions: print(
+            f"{label:<8} převedeno {done:>10}  kolizí {collisions}", flush=True))
+
+        ok = True
+        for label, (converted, collisions) in results.items():
+            print(f"{label}: převedeno {converted}, kolizí {len(collisions)}")
+            for legacy_id in collisions:
+                ok = False
+                print(f"  nepřevedeno (kolize nebo chybí jméno/cesta): {legacy_id}")
+        return ok
+    finally:
+        conn.close()
+
+
+def rebuild_affinity(uri, user, password):
+    """Úplný přepočet hran AFFINE_TO (např. po zápisech nástroji, které je neudržují)"""
+    conn = Neo4jConnection(uri, user, password)
+    try:
+        start = time.time()
+        MusicRecommender(conn).rebuild_artist_affinity()
+        print(f"Afinity umělců přepočítány za {time.time() - start:.1f} s")
+        return True
+    finally:
+        conn.close()
+
+
+def verify_import(output_dir, uri, user, password):
+    """Ověření počtů po importu a vytvoření indexů"""
+    conn = Neo4jConnection(uri, user, password)
+    try:
+        scanner = MusicLibraryScanner(conn)
+        scanner.ensure_indexes()
+        MusicRecommender(conn).ensure_indexes()
+
+        ok = True
+        for name, (expected, actual) in scanner.verify_bulk_import(output_dir).items():
+            status = "OK" if expected == actual else "NESEDÍ"
+            ok = ok and expected == actual
+            print(f"{name:<16} očekáváno {expected:>10}  v databázi {actual:>10}  {status}")
+        return ok
+    finally:
+        conn.close()
+
+
 def main():
-    root = tk.Tk()
-    app = MusicPlayerApp(root)
+    parser = argparse.ArgumentParser(description="Hudební přehrávač s Neo4j")
+    parser.add_argument("--bulk-export", nargs=2, metavar=("MUSIC_DIR", "OUTPUT_DIR"),
+                        help="offline export knihovny do CSV pro neo4j-admin import")
+    parser.add_argument("--scan", metavar="MUSIC_DIR",
+                        help="naskenuje knihovnu do databáze bez GUI a vypisuje průběh")
+    parser.add_argument("--content-identity", action="store_true",
+                        help="trackId podle obsahu souboru místo cesty (pro --bulk-export a --scan)")
+    parser.add_argument("--verify-import", metavar="OUTPUT_DIR",
+                        help="porovná počty v databázi s manifestem exportu")
+    parser.add_argument("--migrate-ids", action="store_true",
+                        help="převede stará hex ID uzlů na 64bitová čísla (po dávkách)")
+    parser.add_argument("--rebuild-affinity", action="store_true",
+                        help="přepočítá hrany AFFINE_TO (Fan Zone) z poslechů fanoušků")
+    parser.add_argument("--uri", default="neo4j://127.0.0.1:7687")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="vypisuje dobu importů a inicializace jednotlivých subsystémů")
+    args = parser.parse_args()
+    startup_profiler.enabled = args.profile_startup
+
+    identity_mode = (MusicLibraryScanner.IDENTITY_CONTENT if args.content_identity
+                     else MusicLibraryScanner.IDENTITY_PATH)
+    if args.bulk_export:
+        bulk_export(*args.bulk_export, identity_mode)
+        return
+    if args.scan:
+        raise SystemExit(0 if headless_scan(args.scan, args.uri, args.user, args.password, identity_mode) else 1)
+    if args.migrate_ids:
+        raise SystemExit(0 if migrate_ids(args.uri, args.user, args.password) else 1)
+    if args.rebuild_affinity:
+        raise SystemExit(0 if rebuild_affinity(args.uri, args.user, args.password) else 1)
+    if args.verify_import:
+        raise SystemExit(0 if verify_import(args.verify_import, args.uri, args.user, args.password) else 1)
+
+    startup_profiler.mark("module import")
+    with startup_profiler.measure("tk.Tk()"):
+        root = tk.Tk()
+    with startup_profiler.measure("MusicPlayerApp"):
+        app = MusicPlayerApp(root)
+    root.update_idletasks()
+    startup_profiler.mark("first window")
     root.mainloop()
 
 
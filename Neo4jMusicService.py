@@ -0,0 +1,355 @@
+# Instalace závislostí:
+# pip install neo4j mutagen aiohttp
+
+import argparse
+import asyncio
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from aiohttp import web
+
+from Neo4jMusicPlayer import (Neo4jConnection, AsyncNeo4jConnection, UserManager,
+                              MusicLibraryScanner, MusicRecommender, AsyncMusicRecommender,
+                              RadioSession, PopularityLeaderboards, format_id, parse_id)
+
+
+# === 1. SDÍLENÁ CACHE VÝSLEDKŮ ===
+class ResultCache:
+    """TTL cache výsledků se slučováním souběžných stejných požadavků"""
+
+    def __init__(self, ttl=30.0, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}    # klíč -> (čas vypršení, výsledek)
+        self._inflight = {}   # klíč -> asyncio.Task právě běžícího výpočtu
+
+    async def get_or_compute(self, key, compute):
+        """Vrátí výsledek z cache, připojí se k běžícímu výpočtu, nebo spustí nový.
+        Výpočet běží jako samostatná úloha - zrušení kteréhokoli volajícího ho nezruší
+        a ostatní čekající dostanou výsledek."""
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._compute(key, compute))
+            task.add_done_callback(lambda t: self._finished(key, t))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _compute(self, key, compute):
+        result = await compute()
+        # Výpočet odpojený přes invalidate doběhne jen pro své čekající, neuloží se
+        if self._inflight.get(key) is asyncio.current_task():
+            self._store(key, result)
+        return result
+
+    def _finished(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Označí výjimku jako převzatou, i když na výsledek už nikdo nečeká
+        if not task.cancelled():
+            task.exception()
+
+    def invalidate(self, prefix):
+        """Zneplatní všechny záznamy, jejichž klíč začíná daným prefixem. Běžící výpočty
+        se odpojí - mohly číst stav před změnou, další dotaz proto spustí nový."""
+        for key in [k for k in self._entries if k[:len(prefix)] == prefix]:
+            del self._entries[key]
+        for key in [k for k in self._inflight if k[:len(prefix)] == prefix]:
+            del self._inflight[key]
+
+    def _store(self, key, result):
+        if len(self._entries) >= self.max_entries:
+            # Nejdřív zahodit prošlé záznamy, pak nejstarší vložený
+            now = time.monotonic()
+            for k in [k for k, (expires, _) in self._entries.items() if expires <= now]:
+                del self._entries[k]
+            if len(self._entries) >= self.max_entries:
+                del self._entries[next(iter(self._entries))]
+        self._entries[key] = (time.monotonic() + self.ttl, result)
+
+
+# === 2. SLUŽBA ===
+class MusicService:
+    ALGORITHMS = ("collaborative", "content", "hybrid")
+    MAX_PAGE_SIZE = 500
+    MAX_RADIO_SESSIONS = 1000
+    RADIO_IDLE_TTL = 600.0  # s, nepoužívané rádio se zahodí
+
+    def __init__(self, neo4j_conn, async_conn, workers=32, cache_ttl=30.0):
+        self.conn = neo4j_conn
+        self.async_conn = async_conn
+        self.user_manager = UserManager(neo4j_conn)
+        self.scanner = MusicLibraryScanner(neo4j_conn)
+        self.leaderboards = PopularityLeaderboards()
+        self.recommender = MusicRecommender(neo4j_conn, leaderboards=self.leaderboards)
+        self.async_recommender = AsyncMusicRecommender(async_conn)
+        self.cache = ResultCache(ttl=cache_ttl)
+        self.radio_sessions = {}  # sessionId -> RadioSession, od nejdéle nepoužitého
+        # Blokující dotazy neo4j driveru běží ve vláknech, driver sdílí pool spojení
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def _recommend(self, algorithm, user_id, limit, alpha):
+        if algorithm == "collaborative":
+            return self.recommender.collaborative_filtering(user_id, limit)
+        if algorithm == "content":
+            return self.recommender.content_based_filtering(user_id, limit)
+        return self.recommender.hybrid_recommendation(user_id, limit, alpha)
+
+    # --- Handlery ---
+    async def login(self, request):
+        body = await request.json()
+        username = str(body.get("username", "")).strip()
+        if not username:
+            raise web.HTTPBadRequest(text="Chybí username")
+
+        if body.get("register"):
+            user_id, msg = await self._run(self.user_manager.register_user, username)
+            error_status = 409
+        else:
+            user_id, msg = await self._run(self.user_manager.login_user, username)
+            error_status = 404
+
+        if not user_id:
+            return _json_response({"error": msg}, status=error_status)
+        return _json_response({"userId": user_id, "name": username, "message": msg})
+
+    async def tracks(self, request):
+        offset = _int_param(request, "offset", 0, minimum=0)
+        limit = _int_param(request, "limit", 100, minimum=1, maximum=self.MAX_PAGE_SIZE)
+
+        rows = await self.cache.get_or_compute(
+            ("tracks", offset, limit),
+            lambda: self._run(self.scanner.get_tracks_page, offset, limit)
+        )
+        return _json_response({"offset": offset, "limit": limit, "tracks": rows})
+
+    async def recommendations(self, request):
+        user_id = parse_id(request.query.get("userId"))
+        if not user_id:
+            raise web.HTTPBadRequest(text="Chybí userId")
+        algorithm = request.query.get("algorithm", "hybrid")
+        if algorithm not in self.ALGORITHMS:
+            raise web.HTTPBadRequest(text=f"Neznámý algoritmus: {algorithm}")
+        limit = _int_param(request, "limit", 10, minimum=1, maximum=100)
+        try:
+            alpha = float(request.query.get("alpha", 0.6))
+        except ValueError:
+            raise web.HTTPBadRequest(text="Neplatná hodnota alpha")
+
+        # Stejné souběžné požadavky se spočítají jen jednou
+        rows = await self.cache.get_or_compute(
+            ("recommendations", user_id, algorithm, limit, alpha),
+            lambda: self._run(self._recommend, algorithm, user_id, limit, alpha)
+        )
+        return _json_response({"algorithm": algorithm, "recommendations": rows})
+
+    async def compare_recommendations(self, request):
+        """Všechny algoritmy (a Fan Zone umělce) souběžně přes async driver"""
+        user_id = parse_id(request.query.get("userId"))
+        if not user_id:
+            raise web.HTTPBadRequest(text="Chybí userId")
+        artist_id = parse_id(request.query.get("artistId"))
+        limit = _int_param(request, "limit", 10, minimum=1, maximum=100)
+        try:
+            alpha = float(request.query.get("alpha", 0.6))
+        except ValueError:
+            raise web.HTTPBadRequest(text="Neplatná hodnota alpha")
+
+        result = await self.cache.get_or_compute(
+            ("recommendations", user_id, "compare", artist_id, limit, alpha),
+            lambda: self.async_recommender.compare_all(user_id, artist_id, limit, alpha)
+        )
+        return _json_response(result)
+
+    async def listen(self, request):
+        body = await request.json()
+        try:
+            user_id = parse_id(body["userId"])
+            track_id = parse_id(body["trackId"])
+            duration = int(body["duration"])
+        except (KeyError, TypeError, ValueError):
+            raise web.HTTPBadRequest(text="Očekáváno userId, trackId a duration")
+        listen_date = body.get("listenDate") or datetime.now().isoformat()
+
+        await self._run(self.recommender.record_listen, user_id, track_id, duration, listen_date)
+        # Nový poslech mění doporučení uživatele
+        self.cache.invalidate(("recommendations", user_id))
+        for session in self.radio_sessions.values():
+            if session.user_id == user_id:
+                session.mark_played(track_id)
+        return _json_response({"status": "ok"})
+
+    async def popular(self, request):
+        """Žebříček popularity - čte se z paměti, bez dotazu do databáze"""
+        window = request.query.get("window", "7d")
+        if window not in PopularityLeaderboards.WINDOWS:
+            raise web.HTTPBadRequest(text=f"Neznámé okno: {window}")
+        genre = request.query.get("genre")
+        limit = _int_param(request, "limit", 10, minimum=1, maximum=self.leaderboards.top_k)
+
+        ranking = self.leaderboards.top(window, genre, limit)
+        return _json_response({
+            "window": window, "genre": genre,
+            "tracks": [{"trackId": track_id, "listens": count} for track_id, count in ranking],
+        })
+
+    async def start_radio(self, request):
+        """Založí rádio a vrátí jeho sessionId, stránky se čtou přes GET /radio/{id}"""
+        body = await request.json()
+        user_id = parse_id(body.get("userId"))
+        if not user_id:
+            raise web.HTTPBadRequest(text="Chybí userId")
+        algorithm = body.get("algorithm", "hybrid")
+        if algorithm not in RadioSession.SOURCES:
+            raise web.HTTPBadRequest(text=f"Neznámý algoritmus: {algorithm}")
+        try:
+            alpha = float(body.get("alpha", 0.6))
+        except (TypeError, ValueError):
+            raise web.HTTPBadRequest(text="Neplatná hodnota alpha")
+
+        # Nejdéle nepoužitá session se zahodí, aby počet otevřených rádií nerostl bez omezení
+        self._expire_radio_sessions()
+        if len(self.radio_sessions) >= self.MAX_RADIO_SESSIONS:
+            self.radio_sessions.pop(next(iter(self.radio_sessions))).close()
+
+        session_id = uuid.uuid4().hex
+        self.radio_sessions[session_id] = RadioSession(self.recommender, user_id, self.executor,
+                                                       algorithm, alpha)
+        return _json_response({"sessionId": session_id})
+
+    async def radio_page(self, request):
+        session = self._radio_session(request)
+        size = _int_param(request, "size", 10, minimum=1, maximum=100)
+        # Na doplnění poolu se čeká v event loopu, vlákno executoru drží jen samotný dotaz
+        while True:
+            page, refill = session.try_next_page(size)
+            if page is not None:
+                return _json_response(page)
+            await asyncio.wrap_future(refill)
+
+    async def stop_radio(self, request):
+        self._radio_session(request)
+        self.radio_sessions.pop(request.match_info["session_id"]).close()
+        return _json_response({"status": "ok"})
+
+    def _radio_session(self, request):
+        self._expire_radio_sessions()
+        session = self.radio_sessions.pop(request.match_info["session_id"], None)
+        if session is None:
+            raise web.HTTPNotFound(text="Rádio neexistuje nebo vypršelo")
+        # Naposledy použitá session se přesune na konec
+        self.radio_sessions[request.match_info["session_id"]] = session
+        return session
+
+    def _expire_radio_sessions(self):
+        """Zahodí rádia nepoužitá déle než RADIO_IDLE_TTL (leží na začátku slovníku)"""
+        deadline = time.monotonic() - self.RADIO_IDLE_TTL
+        while self.radio_sessions:
+            session_id, session = next(iter(self.radio_sessions.items()))
+            if session.last_used > deadline:
+                break
+            del self.radio_sessions[session_id]
+            session.close()
+
+    async def fan_zone(self, request):
+        artist_id = parse_id(request.match_info["artist_id"])
+        user_id = parse_id(request.query.get("userId"))
+
+        rows = await self.cache.get_or_compute(
+            ("fanzone", artist_id, user_id),
+            lambda: self._run(self.recommender.get_fan_community_stats, artist_id, user_id)
+        )
+        if not rows:
+            raise web.HTTPNotFound(text="Umělec neexistuje")
+        return _json_response(rows[0])
+
+    def build_app(self):
+        app = web.Application()
+        app.add_routes([
+            web.post("/login", self.login),
+            web.get("/tracks", self.tracks),
+            web.get("/recommendations", self.recommendations),
+            web.get("/recommendations/compare", self.compare_recommendations),
+            web.post("/listen", self.listen),
+            web.get("/artists/{artist_id}/fanzone", self.fan_zone),
+            web.get("/popular", self.popular),
+            web.post("/radio", self.start_radio),
+            web.get("/radio/{session_id}", self.radio_page),
+            web.delete("/radio/{session_id}", self.stop_radio),
+        ])
+        app.on_cleanup.append(self._cleanup)
+        return app
+
+    async def _cleanup(self, app):
+        for session in self.radio_sessions.values():
+            session.close()
+        self.executor.shutdown(wait=False)
+        self.conn.close()
+        await self.async_conn.close()
+
+
+ID_FIELDS = frozenset({"userId", "trackId", "artistId"})
+
+
+def _export_ids(value):
+    """Kopie odpovědi s identifikátory převedenými na text (format_id)"""
+    if isinstance(value, dict):
+        return {key: format_id(item) if key in ID_FIELDS else _export_ids(item)
+                for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_export_ids(item) for item in value]
+    return value
+
+
+def _json_response(data, **kwargs):
+    return web.json_response(_export_ids(data), **kwargs)
+
+
+def _int_param(request, name, default, minimum=None, maximum=None):
+    try:
+        value = int(request.query.get(name, default))
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"Neplatná hodnota {name}")
+    if minimum is not None:
+        value = max(minimum, value)
+    if maximum is not None:
+        value = min(maximum, value)
+    return value
+
+
+# === 3. SPUŠTĚNÍ SLUŽBY ===
+def main():
+    parser = argparse.ArgumentParser(description="HTTP/JSON služba doporučování hudby nad Neo4j")
+    parser.add_argument("--uri", default="neo4j://127.0.0.1:7687")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=32,
+                        help="počet vláken pro dotazy (zároveň velikost poolu spojení)")
+    parser.add_argument("--cache-ttl", type=float, default=30.0)
+    args = parser.parse_args()
+
+    conn = Neo4jConnection(args.uri, args.user, args.password,
+                           max_connection_pool_size=args.workers)
+    conn.verify_connection()
+    async_conn = AsyncNeo4jConnection(args.uri, args.user, args.password,
+                                      max_connection_pool_size=args.workers)
+
+    service = MusicService(conn, async_conn, workers=args.workers, cache_ttl=args.cache_ttl)
+    service.scanner.ensure_indexes()
+    service.recommender.ensure_indexes()
+    service.leaderboards.bootstrap(conn)
+    web.run_app(service.build_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
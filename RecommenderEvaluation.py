@@ -0,0 +1,269 @@
+# Instalace závislostí:
+# pip install neo4j
+#
+# Offline vyhodnocení doporučovacích algoritmů (kvalita + latence):
+#   1) snímek produkční databáze:
+#      python RecommenderEvaluation.py export --password heslo123 --out snapshot.json.gz
+#   2) vyhodnocení nad samostatnou (testovací) databází - ta se PŘEMAŽE trénovací částí snímku:
+#      python RecommenderEvaluation.py evaluate --snapshot snapshot.json.gz \
+#          --uri neo4j://127.0.0.1:7688 --password test --wipe --alpha 0.2 0.4 0.6 0.8
+
+import argparse
+import asyncio
+import gzip
+import json
+import math
+import time
+
+from Neo4jMusicPlayer import (Neo4jConnection, AsyncNeo4jConnection, MusicRecommender,
+                              AsyncMusicRecommender)
+
+
+# === 1. SNÍMEK DATABÁZE ===
+def export_snapshot(conn, path):
+    """Uloží katalog, uživatele, poslechy a fanoušky do jednoho JSON souboru"""
+    snapshot = {
+        "tracks": list(conn.stream("""
+        MATCH (t:Track)-[:IS_PERFORMED_BY]->(a:Artist)
+        OPTIONAL MATCH (t)-[:BELONGS_TO]->(g:Genre)
+        RETURN t.trackId as trackId, t.title as title, t.duration as duration,
+               t.filePath as filePath, a.artistId as artistId, a.name as artist, g.name as genre
+        """)),
+        "users": list(conn.stream("MATCH (u:User) RETURN u.userId as userId, u.name as name")),
+        "listens": list(conn.stream("""
+        MATCH (u:User)-[l:LISTENED_TO]->(t:Track)
+        RETURN u.userId as userId, t.trackId as trackId,
+               l.listenDate as listenDate, l.listenDuration as listenDuration
+        """)),
+        "fans": list(conn.stream("""
+        MATCH (u:User)-[:IS_A_FAN_OF]->(a:Artist)
+        RETURN u.userId as userId, a.artistId as artistId
+        """)),
+    }
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+    return {name: len(rows) for name, rows in snapshot.items()}
+
+
+def load_snapshot(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def split_by_time(listens, holdout_fraction):
+    """Rozdělí poslechy každého uživatele podle času: starší -> trénink, novější -> holdout.
+    Uživatelé s méně než dvěma poslechy zůstanou celí v tréninku."""
+    by_user = {}
+    for listen in listens:
+        by_user.setdefault(listen["userId"], []).append(listen)
+
+    train, holdout = [], {}
+    for user_id, user_listens in by_user.items():
+        user_listens.sort(key=lambda l: l["listenDate"] or "")
+        n_holdout = int(len(user_listens) * holdout_fraction)
+        if len(user_listens) < 2 or n_holdout == 0:
+            train.extend(user_listens)
+            continue
+        train.extend(user_listens[:-n_holdout])
+        holdout[user_id] = {l["trackId"] for l in user_listens[-n_holdout:]}
+    return train, holdout
+
+
+# === 2. NAHRÁNÍ TRÉNOVACÍ ČÁSTI DO TESTOVACÍ DATABÁZE ===
+BATCH_SIZE = 5000
+
+
+def _write_batched(conn, query, rows):
+    for i in range(0, len(rows), BATCH_SIZE):
+        conn.query(query, {"rows": rows[i:i + BATCH_SIZE]})
+
+
+def load_training_graph(conn, snapshot, train_listens):
+    """Smaže testovací databázi a nahraje do ní katalog a trénovací poslechy"""
+    conn.query("""
+    MATCH (n)
+    CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS
+    """)
+    recommender = MusicRecommender(conn)
+    recommender.ensure_indexes()
+    conn.query("CREATE INDEX genre_name IF NOT EXISTS FOR (g:Genre) ON (g.name)")
+
+    tracks = snapshot["tracks"]
+    _write_batched(conn, """
+    UNWIND $rows as row
+    MERGE (a:Artist {artistId: row.artistId}) ON CREATE SET a.name = row.artist
+    """, [{"artistId": t["artistId"], "artist": t["artist"]} for t in tracks])
+    _write_batched(conn, """
+    UNWIND $rows as row
+    MERGE (g:Genre {name: row.genre})
+    """, [{"genre": g} for g in {t["genre"] for t in tracks if t["genre"] is not None}])
+    _write_batched(conn, """
+    UNWIND $rows as row
+    MATCH (a:Artist {artistId: row.artistId})
+    MERGE (t:Track {trackId: row.trackId})
+    ON CREATE SET t.title = row.title, t.duration = row.duration, t.filePath = row.filePath
+    MERGE (t)-[:IS_PERFORMED_BY]->(a)
+    WITH t, row
+    WHERE row.genre IS NOT NULL
+    MATCH (g:Genre {name: row.genre})
+    MERGE (t)-[:BELONGS_TO]->(g)
+    """, tracks)
+    _write_batched(conn, """
+    UNWIND $rows as row
+    MERGE (u:User {userId: row.userId}) ON CREATE SET u.name = row.name
+    """, snapshot["users"])
+    _write_batched(conn, """
+    UNWIND $rows as row
+    MATCH (u:User {userId: row.userId}), (t:Track {trackId: row.trackId})
+    MERGE (u)-[l:LISTENED_TO]->(t)
+    SET l.listenDate = row.listenDate, l.listenDuration = row.listenDuration
+    """, train_listens)
+    _write_batched(conn, """
+    UNWIND $rows as row
+    MATCH (u:User {userId: row.userId}), (a:Artist {artistId: row.artistId})
+    MERGE (u)-[:IS_A_FAN_OF]->(a)
+    """, snapshot["fans"])
+    # Hromadné zápisy výše hrany AFFINE_TO neudržují
+    recommender.rebuild_artist_affinity()
+
+
+# === 3. METRIKY ===
+def precision_recall_ndcg(recommended, relevant, k):
+    top = recommended[:k]
+    hits = [1 if track_id in relevant else 0 for track_id in top]
+    precision = sum(hits) / k
+    recall = sum(hits) / len(relevant)
+    dcg = sum(hit / math.log2(rank + 2) for rank, hit in enumerate(hits))
+    idcg = sum(1 / math.log2(rank + 2) for rank in range(min(k, len(relevant))))
+    return precision, recall, dcg / idcg
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+async def evaluate_algorithm(recommender, name, holdout, k, batch_size, alpha=None):
+    """Přehraje holdout všech uživatelů proti jednomu algoritmu po dávkách"""
+    if name == "collaborative":
+        call = lambda user_id: recommender.collaborative_filtering(user_id, k)
+    elif name == "content":
+        call = lambda user_id: recommender.content_based_filtering(user_id, k)
+    else:
+        call = lambda user_id: recommender.hybrid_recommendation(user_id, k, alpha)
+
+    async def timed(user_id):
+        start = time.perf_counter()
+        rows = await call(user_id)
+        return user_id, [row["trackId"] for row in rows], time.perf_counter() - start
+
+    users = list(holdout)
+    results = []
+    for i in range(0, len(users), batch_size):
+        results.extend(await asyncio.gather(*[timed(u) for u in users[i:i + batch_size]]))
+
+    precision = recall = ndcg = 0.0
+    recommended_tracks = set()
+    latencies = []
+    for user_id, recommended, latency in results:
+        p, r, n = precision_recall_ndcg(recommended, holdout[user_id], k)
+        precision += p
+        recall += r
+        ndcg += n
+        recommended_tracks.update(recommended)
+        latencies.append(latency * 1000)
+
+    n_users = max(len(results), 1)
+    return {
+        "algorithm": name if alpha is None else f"{name} (alpha={alpha})",
+        "precision": precision / n_users,
+        "recall": recall / n_users,
+        "ndcg": ndcg / n_users,
+        "recommended_tracks": recommended_tracks,
+        "latencies": latencies,
+    }
+
+
+def report(results, n_tracks, k):
+    print(f"\n{'algoritmus':<28}{'P@' + str(k):>8}{'R@' + str(k):>8}{'nDCG':>8}{'pokrytí':>9}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for r in results:
+        coverage = len(r["recommended_tracks"]) / max(n_tracks, 1)
+        print(f"{r['algorithm']:<28}{r['precision']:>8.3f}{r['recall']:>8.3f}{r['ndcg']:>8.3f}"
+              f"{coverage:>9.1%}{percentile(r['latencies'], 50):>9.1f}"
+              f"{percentile(r['latencies'], 95):>9.1f}{percentile(r['latencies'], 99):>9.1f}")
+
+
+async def run_evaluation(args, holdout, n_tracks):
+    conn = AsyncNeo4jConnection(args.uri, args.user, args.password)
+    recommender = AsyncMusicRecommender(conn)
+    try:
+        results = []
+        for name in args.algorithms:
+            for alpha in (args.alpha if name == "hybrid" else [None]):
+                results.append(await evaluate_algorithm(recommender, name, holdout, args.k,
+                                                        args.batch_size, alpha))
+        report(results, n_tracks, args.k)
+    finally:
+        await conn.close()
+
+
+# === 4. SPUŠTĚNÍ ===
+def main():
+    parser = argparse.ArgumentParser(description="Offline vyhodnocení doporučovacích algoritmů")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for name in ("export", "evaluate"):
+        p = sub.add_parser(name)
+        p.add_argument("--uri", default="neo4j://127.0.0.1:7687")
+        p.add_argument("--user", default="neo4j")
+        p.add_argument("--password", required=True)
+
+    sub.choices["export"].add_argument("--out", required=True, help="cílový soubor .json.gz")
+
+    ev = sub.choices["evaluate"]
+    ev.add_argument("--snapshot", required=True)
+    ev.add_argument("--wipe", action="store_true",
+                    help="potvrzení, že se cílová (testovací!) databáze smaže a nahraje znovu")
+    ev.add_argument("--skip-load", action="store_true",
+                    help="testovací databáze už obsahuje trénovací část stejného snímku")
+    ev.add_argument("--holdout", type=float, default=0.2, help="podíl nejnovějších poslechů do holdoutu")
+    ev.add_argument("--k", type=int, default=10)
+    ev.add_argument("--alpha", type=float, nargs="+", default=[0.6], help="hodnoty alpha pro hybridní")
+    ev.add_argument("--algorithms", nargs="+", default=list(AsyncMusicRecommender.ALGORITHMS),
+                    choices=AsyncMusicRecommender.ALGORITHMS)
+    ev.add_argument("--batch-size", type=int, default=50, help="počet souběžných dotazů v dávce")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        conn = Neo4jConnection(args.uri, args.user, args.password)
+        try:
+            print(f"Snímek uložen do {args.out}: {export_snapshot(conn, args.out)}")
+        finally:
+            conn.close()
+        return
+
+    snapshot = load_snapshot(args.snapshot)
+    train, holdout = split_by_time(snapshot["listens"], args.holdout)
+    print(f"Uživatelů s holdoutem: {len(holdout)}, trénovacích poslechů: {len(train)}, "
+          f"holdout poslechů: {sum(len(h) for h in holdout.values())}")
+
+    if not args.skip_load:
+        if not args.wipe:
+            parser.error("evaluate přemaže cílovou databázi - potvrďte to přepínačem --wipe "
+                         "(nikdy ne proti produkci), nebo použijte --skip-load")
+        conn = Neo4jConnection(args.uri, args.user, args.password)
+        try:
+            start = time.time()
+            load_training_graph(conn, snapshot, train)
+            print(f"Trénovací graf nahrán za {time.time() - start:.1f} s")
+        finally:
+            conn.close()
+
+    asyncio.run(run_evaluation(args, holdout, len(snapshot["tracks"])))
+
+
+if __name__ == "__main__":
+    main()
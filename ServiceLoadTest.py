@@ -0,0 +1,108 @@
+# Instalace závislostí:
+# pip install aiohttp
+#
+# Zátěžový test služby Neo4jMusicService.py (musí běžet proti lokální databázi):
+#   python Neo4jMusicService.py --password heslo123
+#   python ServiceLoadTest.py --clients 300 --duration 30
+
+import argparse
+import asyncio
+import random
+import time
+
+import aiohttp
+
+
+# === 1. SIMULACE KLIENTA ===
+async def prepare_users(session, base_url, count):
+    """Zaregistruje (nebo přihlásí) testovací uživatele a vrátí jejich userId"""
+    user_ids = []
+    for i in range(count):
+        username = f"loadtest_{i}"
+        async with session.post(f"{base_url}/login", json={"username": username, "register": True}) as resp:
+            data = await resp.json()
+        if "userId" not in data:
+            async with session.post(f"{base_url}/login", json={"username": username}) as resp:
+                data = await resp.json()
+        user_ids.append(data["userId"])
+    return user_ids
+
+
+async def client(session, base_url, user_ids, track_ids, deadline, stats):
+    """Jeden klient: stránkování, doporučení a poslechy v náhodném pořadí"""
+    while time.monotonic() < deadline:
+        user_id = random.choice(user_ids)
+        roll = random.random()
+        if roll < 0.5:
+            algorithm = random.choice(("collaborative", "content", "hybrid"))
+            method, url, kwargs = "GET", f"{base_url}/recommendations", {
+                "params": {"userId": user_id, "algorithm": algorithm}}
+            name = "recommendations"
+        elif roll < 0.8 or not track_ids:
+            method, url, kwargs = "GET", f"{base_url}/tracks", {
+                "params": {"offset": random.randrange(0, 1000, 50), "limit": 50}}
+            name = "tracks"
+        else:
+            method, url, kwargs = "POST", f"{base_url}/listen", {
+                "json": {"userId": user_id, "trackId": random.choice(track_ids),
+                         "duration": random.randint(10, 240)}}
+            name = "listen"
+
+        start = time.perf_counter()
+        try:
+            async with session.request(method, url, **kwargs) as resp:
+                await resp.read()
+                ok = resp.status < 400
+        except aiohttp.ClientError:
+            ok = False
+        stats.setdefault(name, []).append((time.perf_counter() - start, ok))
+
+
+# === 2. VYHODNOCENÍ ===
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def report(stats, elapsed, clients):
+    total = sum(len(samples) for samples in stats.values())
+    print(f"\nKlientů: {clients}, doba: {elapsed:.1f} s, požadavků: {total}, "
+          f"propustnost: {total / elapsed:.1f} req/s\n")
+    print(f"{'endpoint':<16}{'počet':>8}{'chyby':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, samples in sorted(stats.items()):
+        latencies = [latency * 1000 for latency, _ in samples]
+        errors = sum(1 for _, ok in samples if not ok)
+        print(f"{name:<16}{len(samples):>8}{errors:>8}{len(samples) / elapsed:>10.1f}"
+              f"{percentile(latencies, 50):>10.1f}{percentile(latencies, 95):>10.1f}"
+              f"{percentile(latencies, 99):>10.1f}")
+
+
+async def run(args):
+    connector = aiohttp.TCPConnector(limit=args.clients)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        user_ids = await prepare_users(session, args.url, args.users)
+        async with session.get(f"{args.url}/tracks", params={"limit": 500}) as resp:
+            track_ids = [t["trackId"] for t in (await resp.json())["tracks"]]
+
+        stats = {}
+        start = time.monotonic()
+        deadline = start + args.duration
+        await asyncio.gather(*[client(session, args.url, user_ids, track_ids, deadline, stats)
+                               for _ in range(args.clients)])
+        report(stats, time.monotonic() - start, args.clients)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zátěžový test služby doporučování hudby")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--clients", type=int, default=200, help="počet souběžných klientů")
+    parser.add_argument("--users", type=int, default=20, help="počet testovacích uživatelů")
+    parser.add_argument("--duration", type=float, default=30.0, help="délka testu v sekundách")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Moduly projektu leží v kořeni repozitáře (bez balíčku)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
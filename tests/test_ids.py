@@ -0,0 +1,38 @@
+import pytest
+
+from Neo4jMusicPlayer import format_id, parse_id, stable_id
+
+
+@pytest.mark.parametrize("value", [0, 1, -1, 2 ** 53 + 1, 2 ** 63 - 1, -2 ** 63,
+                                   stable_id("track", "/music/a.mp3")])
+def test_round_trip(value):
+    text = format_id(value)
+    assert len(text) == 16
+    assert parse_id(text) == value
+
+
+def test_legacy_ids_stay_strings():
+    for legacy in ("1a2b3c4d", "1a2b3c4d5e6f"):
+        assert format_id(legacy) == legacy
+        assert parse_id(legacy) == legacy
+
+
+def test_malformed_ids_are_not_parsed():
+    assert parse_id("12345678901234567") == "12345678901234567"
+    assert parse_id("zzzzzzzzzzzzzzzz") == "zzzzzzzzzzzzzzzz"
+    assert parse_id("12 34 56 78 9a b") == "12 34 56 78 9a b"
+    assert parse_id(None) is None
+
+
+def test_service_exports_ids_as_strings():
+    pytest.importorskip("aiohttp")
+    from Neo4jMusicService import _export_ids
+
+    track_id = stable_id("track", "/music/a.mp3")
+    data = {"userId": -5, "sessionId": "abc", "limit": 10,
+            "tracks": [{"trackId": track_id, "artistId": "1a2b3c4d", "listens": 3}]}
+    assert _export_ids(data) == {
+        "userId": "fffffffffffffffb", "sessionId": "abc", "limit": 10,
+        "tracks": [{"trackId": format_id(track_id), "artistId": "1a2b3c4d", "listens": 3}],
+    }
+    assert data["userId"] == -5  # odpověď z cache se nemění
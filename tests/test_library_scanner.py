@@ -0,0 +1,179 @@
+from pathlib import Path
+
+from Neo4jMusicPlayer import MusicLibraryScanner, audio_content_hash
+
+
+class FakeConnection:
+    """Vrací uzly Track vyhovující filtru STARTS WITH $root, zápisy si pamatuje"""
+
+    def __init__(self, tracks):
+        self.tracks = tracks
+        self.writes = []
+
+    def query(self, query, parameters=None):
+        parameters = parameters or {}
+        if "STARTS WITH $root" in query:
+            return [dict(row) for row in self.tracks
+                    if row["filePath"].startswith(parameters["root"])]
+        self.writes.append((query, parameters))
+        return []
+
+
+def content_scanner(conn):
+    return MusicLibraryScanner(conn, artwork_store=object(),
+                               identity_mode=MusicLibraryScanner.IDENTITY_CONTENT)
+
+
+def test_moves_ignore_sibling_directory_with_common_prefix(tmp_path):
+    library = tmp_path / "music"
+    library.mkdir()
+    new_file = library / "song.mp3"
+    new_file.write_bytes(b"audio" * 100)
+    content_hash, file_size = audio_content_hash(str(new_file))
+
+    # Stejný obsah leží v jiné knihovně (/music2), jejíž soubor chybí
+    conn = FakeConnection([{
+        "trackId": 1, "filePath": str(tmp_path / "music2" / "song.mp3"),
+        "contentHash": content_hash, "fileSize": file_size, "probeVersion": 1,
+    }])
+    pending, backfill = content_scanner(conn)._apply_moves(str(library), [new_file])
+
+    assert pending == [new_file] and backfill == []
+    assert not any(params.get("moves") for _, params in conn.writes)
+
+
+def test_moves_detected_inside_library(tmp_path):
+    library = tmp_path / "music"
+    library.mkdir()
+    new_file = library / "renamed.mp3"
+    new_file.write_bytes(b"audio" * 100)
+    content_hash, file_size = audio_content_hash(str(new_file))
+
+    conn = FakeConnection([{
+        "trackId": 1, "filePath": str(library / "song.mp3"),
+        "contentHash": content_hash, "fileSize": file_size, "probeVersion": 1,
+    }])
+    pending, _ = content_scanner(conn)._apply_moves(str(library), [new_file])
+
+    assert pending == []
+    assert [params["moves"] for _, params in conn.writes] == [
+        [{"track_id": 1, "file_path": str(Path(new_file))}]]
+
+
+class FakeProbe:
+    def probe(self, file_path):
+        return {"duration": 180, "title": "Song", "artist": "Artist", "genre": "Rock",
+                "art_hash": None}
+
+
+class IngestConnection:
+    """Zná jeden uzel Track na cestě, zápis skladby si zapamatuje"""
+
+    def __init__(self, file_path, track_id):
+        self.file_path = file_path
+        self.track_id = track_id
+        self.ingested = None
+
+    def query(self, query, parameters=None):
+        if "RETURN t.trackId as trackId" in query:
+            if parameters["file_path"] == self.file_path:
+                return [{"trackId": self.track_id}]
+            return []
+        self.ingested = parameters
+        return [{"artist_clash": False, "track_clash": False}]
+
+
+def ingest(tmp_path, identity_mode, stored_id, refresh=True):
+    song = tmp_path / "song.mp3"
+    song.write_bytes(b"re-encoded audio" * 50)
+    conn = IngestConnection(str(song), stored_id)
+    scanner = MusicLibraryScanner(conn, artwork_store=object(), identity_mode=identity_mode)
+    scanner.probe = FakeProbe()
+    scanner._process_mp3_file(str(song), refresh=refresh)
+    return conn.ingested
+
+
+def test_refresh_keeps_id_of_node_at_path(tmp_path):
+    # Uzel ze skenování podle cesty, soubor se změnil a sleduje se podle obsahu
+    params = ingest(tmp_path, MusicLibraryScanner.IDENTITY_CONTENT, 42)
+    assert params["track_id"] == 42
+    assert params["refresh"] and params["content_hash"]
+
+
+def test_refresh_converts_legacy_node_in_place(tmp_path):
+    params = ingest(tmp_path, MusicLibraryScanner.IDENTITY_CONTENT, "0123456789ab")
+    assert params["legacy_track_id"] == "0123456789ab"
+    assert isinstance(params["track_id"], int)
+
+
+def test_full_scan_uses_computed_id(tmp_path):
+    params = ingest(tmp_path, MusicLibraryScanner.IDENTITY_CONTENT, 42, refresh=False)
+    assert params["track_id"] != 42
+
+
+class MigrationConnection:
+    """Nepřevedené uzly Track v paměti pro IdMigration"""
+
+    def __init__(self, nodes):
+        self.nodes = nodes  # elementId -> vlastnosti
+
+    def stream(self, query, parameters=None):
+        for node_id, node in list(self.nodes.items()):
+            if isinstance(node["trackId"], str):
+                yield {"id": node_id, "legacy": node["trackId"],
+                       "contentHash": node.get("contentHash"), "filePath": node["filePath"]}
+
+    def query(self, query, parameters=None):
+        taken = {node["trackId"] for node in self.nodes.values()}
+        done = []
+        for row in parameters["rows"]:
+            if row["key"] not in taken:
+                node = self.nodes[row["id"]]
+                node["legacyId"], node["trackId"] = node["trackId"], row["key"]
+                done.append({"id": row["id"]})
+        return done
+
+
+def test_migration_matches_scanner_identity(tmp_path):
+    from Neo4jMusicPlayer import IdMigration
+
+    path_song = tmp_path / "path.mp3"
+    path_song.write_bytes(b"first" * 100)
+    content_song = tmp_path / "content.mp3"
+    content_song.write_bytes(b"second" * 100)
+    path_scanner = MusicLibraryScanner(None, artwork_store=object())
+    content_scanner_ = content_scanner(None)
+
+    # Uzel ze skenování podle cesty s doplněným contentHash a uzel ze skenování podle obsahu
+    path_hash, _ = audio_content_hash(str(path_song))
+    content_hash, _ = audio_content_hash(str(content_song))
+    conn = MigrationConnection({
+        "n1": {"trackId": path_scanner._legacy_track_id(str(path_song), None),
+               "contentHash": path_hash, "filePath": str(path_song)},
+        "n2": {"trackId": content_scanner_._legacy_track_id(str(content_song), content_hash),
+               "contentHash": content_hash, "filePath": str(content_song)},
+    })
+    converted, collisions = IdMigration(conn).migrate_label("Track")
+
+    assert (converted, collisions) == (2, [])
+    assert conn.nodes["n1"]["trackId"] == path_scanner._track_identity(str(path_song))[0]
+    assert conn.nodes["n2"]["trackId"] == content_scanner_._track_identity(str(content_song))[0]
+
+
+def test_migration_streams_label_once_and_reports_collisions(tmp_path):
+    from Neo4jMusicPlayer import IdMigration
+
+    nodes = {f"n{i}": {"trackId": f"{i:012x}", "filePath": f"/music/{i}.mp3"} for i in range(7)}
+    nodes["dup"] = {"trackId": "ffffffffffff", "filePath": "/music/3.mp3"}  # stejný vstup hashe
+    conn = MigrationConnection(nodes)
+    streams = []
+    stream = conn.stream
+    conn.stream = lambda query, parameters=None: streams.append(query) or stream(query)
+
+    progress = []
+    converted, collisions = IdMigration(conn, batch_size=3).migrate_label(
+        "Track", lambda label, done, clashes: progress.append((done, clashes)))
+
+    assert len(streams) == 1
+    assert converted == 7 and collisions == ["ffffffffffff"]
+    assert progress[-1] == (7, 1)
@@ -0,0 +1,103 @@
+import threading
+import time
+
+from Neo4jMusicPlayer import LibraryChangeSet, LibraryWatcher
+
+
+def test_created_then_deleted_cancels_out():
+    changes = LibraryChangeSet()
+    changes.add("created", "a.mp3")
+    changes.add("deleted", "a.mp3")
+    assert not changes
+
+
+def test_deleted_then_created_is_update():
+    changes = LibraryChangeSet()
+    changes.add("deleted", "a.mp3")
+    changes.add("created", "a.mp3")
+    assert changes.updated == {"a.mp3"}
+    assert not changes.deleted and not changes.created
+
+
+def test_modified_new_file_stays_created():
+    changes = LibraryChangeSet()
+    changes.add("created", "a.mp3")
+    changes.add("modified", "a.mp3")
+    assert changes.created == {"a.mp3"}
+    assert not changes.updated
+
+
+def test_chained_moves_collapse_to_one():
+    changes = LibraryChangeSet()
+    changes.add("moved", "a.mp3", "b.mp3")
+    changes.add("moved", "b.mp3", "c.mp3")
+    assert changes.moved == {"a.mp3": "c.mp3"}
+
+
+def test_moved_then_deleted_deletes_source():
+    changes = LibraryChangeSet()
+    changes.add("moved", "a.mp3", "b.mp3")
+    changes.add("deleted", "b.mp3")
+    assert changes.deleted == {"a.mp3"}
+    assert not changes.moved
+
+
+def test_move_of_created_file_is_create_at_destination():
+    changes = LibraryChangeSet()
+    changes.add("created", "a.mp3")
+    changes.add("moved", "a.mp3", "b.mp3")
+    assert changes.created == {"b.mp3"}
+    assert not changes.moved
+
+
+def test_updated_file_keeps_update_after_move():
+    changes = LibraryChangeSet()
+    changes.add("modified", "a.mp3")
+    changes.add("moved", "a.mp3", "b.mp3")
+    assert changes.updated == {"b.mp3"}
+    assert changes.moved == {"a.mp3": "b.mp3"}
+
+
+class RecordingScanner:
+    def __init__(self):
+        self.applied = []
+        self.done = threading.Event()
+
+    def ensure_indexes(self):
+        pass
+
+    def apply_changes(self, changes, max_files_per_second=None):
+        self.applied.append(changes)
+        self.done.set()
+        return {"deleted": [], "moved": {}, "tracks": []}
+
+
+def test_record_ignores_non_mp3_and_maps_renames(tmp_path):
+    watcher = LibraryWatcher(RecordingScanner(), tmp_path)
+    watcher.record("created", str(tmp_path / "cover.jpg"))
+    assert not watcher._changes
+
+    # Přejmenování na .mp3 je nový soubor, z .mp3 pryč je smazání
+    watcher.record("moved", str(tmp_path / "a.tmp"), str(tmp_path / "a.mp3"))
+    watcher.record("moved", str(tmp_path / "b.mp3"), str(tmp_path / "b.bak"))
+    assert watcher._changes.created == {str(tmp_path / "a.mp3")}
+    assert watcher._changes.deleted == {str(tmp_path / "b.mp3")}
+
+
+def test_polling_watcher_applies_new_file(tmp_path):
+    scanner = RecordingScanner()
+    watcher = LibraryWatcher(scanner, tmp_path, debounce=0.0, poll_interval=0.0)
+    watcher.uses_polling = True
+
+    start = time.monotonic()
+    watcher.start()
+    # start nečeká na první snímek složky
+    assert time.monotonic() - start < 0.5
+    try:
+        time.sleep(0.2)
+        (tmp_path / "song.mp3").write_bytes(b"data")
+        assert scanner.done.wait(5)
+    finally:
+        watcher.stop()
+
+    assert scanner.applied[0].created == {str(tmp_path / "song.mp3")}
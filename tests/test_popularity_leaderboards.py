@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta
+
+from Neo4jMusicPlayer import PopularityLeaderboards
+
+
+def hours_ago(n):
+    return (datetime.now() - timedelta(hours=n)).isoformat()
+
+
+def test_ranking_by_listens():
+    boards = PopularityLeaderboards()
+    for track_id, listens in ((1, 3), (2, 5), (3, 1)):
+        for _ in range(listens):
+            boards.record(track_id, "Rock")
+    assert boards.top("7d") == [(2, 5), (1, 3), (3, 1)]
+    assert boards.top("all", limit=2) == [(2, 5), (1, 3)]
+
+
+def test_genre_scopes():
+    boards = PopularityLeaderboards()
+    boards.record(1, "Rock")
+    boards.record(2, "Jazz")
+    boards.record(2, "Jazz")
+    boards.record(3, None)
+    assert boards.top("24h", "Rock") == [(1, 1)]
+    assert boards.top("24h", "Jazz") == [(2, 2)]
+    assert [track_id for track_id, _ in boards.top("24h")] == [2, 1, 3]
+    assert boards.genre_of(2) == "Jazz" and boards.knows(3) and not boards.knows(4)
+
+
+def test_old_listen_counts_only_in_wider_windows():
+    boards = PopularityLeaderboards()
+    boards.record(1, "Rock", hours_ago(48))
+    boards.record(2, "Rock", hours_ago(24 * 30))
+    assert boards.top("24h") == []
+    assert boards.top("7d") == [(1, 1)]
+    assert sorted(boards.top("all")) == [(1, 1), (2, 1)]
+
+
+def test_listens_fall_out_of_windows():
+    boards = PopularityLeaderboards()
+    boards.record(1, "Rock")
+    boards.record(2, "Rock", hours_ago(20))
+    with boards._lock:
+        boards._advance(boards._hour + 10)
+    assert boards.top("24h") == [(1, 1)]
+    assert boards.top("7d", "Rock") == [(1, 1), (2, 1)]
+
+    with boards._lock:
+        boards._advance(boards._hour + 24 * 7)
+    assert boards.top("24h") == boards.top("7d") == []
+    assert sorted(boards.top("all")) == [(1, 1), (2, 1)]
+    assert not boards._buckets
+
+
+def test_top_k_trimming():
+    boards = PopularityLeaderboards(top_k=3)
+    for track_id in range(10):
+        for _ in range(track_id + 1):
+            boards.record(track_id, "Rock")
+    assert boards.top("all", limit=10) == [(9, 10), (8, 9), (7, 8)]
+    assert boards.top("7d", "Rock", limit=10) == [(9, 10), (8, 9), (7, 8)]
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def stream(self, query, params=None):
+        return iter(self.rows)
+
+
+def test_bootstrap_from_database():
+    boards = PopularityLeaderboards()
+    boards.bootstrap(FakeConnection([
+        {"trackId": 1, "genre": "Rock", "total": 4, "recent": [hours_ago(1), hours_ago(30)]},
+        {"trackId": 2, "genre": "Jazz", "total": 2, "recent": [hours_ago(2), hours_ago(3)]},
+        {"trackId": 3, "genre": None, "total": 7, "recent": []},
+    ]))
+    assert boards.top("all") == [(3, 7), (1, 4), (2, 2)]
+    assert boards.top("7d") == [(1, 2), (2, 2)]
+    assert boards.top("24h") == [(2, 2), (1, 1)]
+    assert boards.top("all", "Jazz") == [(2, 2)]
+
+
+class DetailsConnection:
+    """Vrací detaily skladeb podle $ids, jiné dotazy si zapamatuje"""
+
+    def __init__(self):
+        self.queries = []
+
+    def query(self, query, parameters=None):
+        self.queries.append(query)
+        if "$ids" in query:
+            return [{"trackId": track_id, "title": f"Song {track_id}"}
+                    for track_id in parameters["ids"]]
+        return []
+
+
+def test_radio_fallback_reads_leaderboards_without_scan():
+    from Neo4jMusicPlayer import MusicRecommender
+
+    boards = PopularityLeaderboards()
+    for track_id, listens in ((1, 3), (2, 5), (3, 1)):
+        for _ in range(listens):
+            boards.record(track_id, "Rock")
+    conn = DetailsConnection()
+    recommender = MusicRecommender(conn, leaderboards=boards)
+
+    rows = recommender.popular_tracks(10, exclude=[2])
+    assert [(row["trackId"], row["popularity"]) for row in rows] == [(1, 3), (3, 1)]
+    assert not any("COUNT {" in query for query in conn.queries)
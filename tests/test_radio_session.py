@@ -0,0 +1,88 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from Neo4jMusicPlayer import RadioSession
+
+
+class FakeRecommender:
+    """Vrací skladby s rostoucím trackId, vynechává exclude; popular má vlastní katalog"""
+
+    def __init__(self, catalogue=1000, popular=()):
+        self.catalogue = catalogue
+        self.popular = list(popular)
+        self.excludes = []
+
+    def hybrid_recommendation(self, user_id, limit, alpha, exclude):
+        self.excludes.append(list(exclude))
+        skip = set(exclude)
+        rows = [{"trackId": i} for i in range(self.catalogue) if i not in skip]
+        return rows[:limit]
+
+    def popular_tracks(self, limit, exclude):
+        skip = set(exclude)
+        return [{"trackId": i} for i in self.popular if i not in skip][:limit]
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        yield pool
+
+
+def test_pages_do_not_repeat(executor):
+    radio = RadioSession(FakeRecommender(), 1, executor, pool_size=20, low_water=5)
+    ids = [t["trackId"] for _ in range(10) for t in radio.next_page(10)["tracks"]]
+    assert len(ids) == len(set(ids)) == 100
+
+
+def test_try_next_page_returns_refill_instead_of_blocking(executor):
+    radio = RadioSession(FakeRecommender(), 1, executor, pool_size=20, low_water=5)
+    page, refill = radio.try_next_page(10)
+    assert page is None
+    refill.result(timeout=5)
+    page, refill = radio.try_next_page(10)
+    assert refill is None and len(page["tracks"]) == 10
+
+
+def test_falls_back_to_popular_then_exhausts(executor):
+    radio = RadioSession(FakeRecommender(catalogue=5, popular=[3, 4, 100, 101]), 1, executor,
+                         pool_size=20, low_water=5)
+    ids = []
+    while True:
+        page = radio.next_page(4)
+        ids += [t["trackId"] for t in page["tracks"]]
+        if page["exhausted"]:
+            break
+    assert ids == [0, 1, 2, 3, 4, 100, 101]
+
+
+def test_seen_is_bounded(executor):
+    recommender = FakeRecommender()
+    radio = RadioSession(recommender, 1, executor, pool_size=20, low_water=5, max_seen=50)
+    for _ in range(20):
+        radio.next_page(10)
+    assert len(radio._seen) == 50
+    assert max(len(exclude) for exclude in recommender.excludes) <= 50
+
+
+def test_mark_played_drops_pooled_track(executor):
+    radio = RadioSession(FakeRecommender(), 1, executor, pool_size=20, low_water=0)
+    radio.next_page(1)
+    radio.mark_played(5)
+    ids = [t["trackId"] for t in radio.next_page(10)["tracks"]]
+    assert 5 not in ids
+
+
+def test_closed_session_does_not_refill(executor):
+    recommender = FakeRecommender()
+    radio = RadioSession(recommender, 1, executor)
+    gate = threading.Event()
+    executor.submit(gate.wait)  # doplnění čeká ve frontě, dokud se rádio nezavře
+    page, refill = radio.try_next_page(10)
+    radio.close()
+    gate.set()
+    refill.result(timeout=5)
+    assert recommender.excludes == []
+    assert radio.next_page(10) == {"cursor": 0, "tracks": [], "exhausted": True}
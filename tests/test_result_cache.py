@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from Neo4jMusicService import ResultCache
+
+
+class SlowCompute:
+    """Výpočet, který skončí až po uvolnění - počítá svá spuštění"""
+
+    def __init__(self, result="rows", error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        return self.result
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_requests_are_coalesced():
+    async def scenario():
+        cache = ResultCache()
+        compute = SlowCompute()
+        waiters = [asyncio.create_task(cache.get_or_compute("k", compute)) for _ in range(5)]
+        await asyncio.sleep(0)
+        compute.release.set()
+        assert await asyncio.gather(*waiters) == ["rows"] * 5
+        assert compute.calls == 1
+        # Další dotaz jde z cache
+        assert await cache.get_or_compute("k", compute) == "rows"
+        assert compute.calls == 1
+
+    run(scenario())
+
+
+def test_cancelled_first_caller_does_not_strand_other_waiters():
+    async def scenario():
+        cache = ResultCache()
+        compute = SlowCompute()
+        first = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        await asyncio.sleep(0)
+        compute.release.set()
+
+        assert await asyncio.wait_for(second, timeout=1) == "rows"
+        assert first.cancelled()
+        assert compute.calls == 1
+
+    run(scenario())
+
+
+def test_result_is_cached_even_if_every_caller_is_cancelled():
+    async def scenario():
+        cache = ResultCache()
+        compute = SlowCompute()
+        caller = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        caller.cancel()
+        compute.release.set()
+        await asyncio.sleep(0.01)
+
+        assert await cache.get_or_compute("k", compute) == "rows"
+        assert compute.calls == 1
+
+    run(scenario())
+
+
+def test_error_reaches_all_waiters_and_is_not_cached():
+    async def scenario():
+        cache = ResultCache()
+        failing = SlowCompute(error=RuntimeError("db down"))
+        waiters = [asyncio.create_task(cache.get_or_compute("k", failing)) for _ in range(3)]
+        await asyncio.sleep(0)
+        failing.release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+        retry = SlowCompute()
+        retry.release.set()
+        assert await cache.get_or_compute("k", retry) == "rows"
+
+    run(scenario())
+
+
+def test_invalidate_by_prefix_and_ttl():
+    async def scenario():
+        cache = ResultCache(ttl=0.05)
+        compute = SlowCompute()
+        compute.release.set()
+        await cache.get_or_compute(("recommendations", 1, "hybrid"), compute)
+        await cache.get_or_compute(("recommendations", 2, "hybrid"), compute)
+
+        cache.invalidate(("recommendations", 1))
+        await cache.get_or_compute(("recommendations", 1, "hybrid"), compute)
+        await cache.get_or_compute(("recommendations", 2, "hybrid"), compute)
+        assert compute.calls == 3
+
+        await asyncio.sleep(0.06)
+        await cache.get_or_compute(("recommendations", 2, "hybrid"), compute)
+        assert compute.calls == 4
+
+    run(scenario())
+
+
+def test_invalidate_detaches_running_computation():
+    async def scenario():
+        cache = ResultCache()
+        stale = SlowCompute(result="stale")
+        fresh = SlowCompute(result="fresh")
+        key = ("recommendations", 1, "hybrid")
+
+        before = asyncio.create_task(cache.get_or_compute(key, stale))
+        await asyncio.sleep(0)
+        cache.invalidate(("recommendations", 1))
+        after = asyncio.create_task(cache.get_or_compute(key, fresh))
+        await asyncio.sleep(0)
+
+        # Starý výpočet doběhne pro své čekající, ale nepřepíše ani neodpojí nový
+        stale.release.set()
+        assert await before == "stale"
+        assert key in cache._inflight and key not in cache._entries
+        fresh.release.set()
+        assert await after == "fresh"
+        assert await cache.get_or_compute(key, stale) == "fresh"
+        assert stale.calls == fresh.calls == 1
+
+    run(scenario())
+
+
+def test_max_entries_evicts_oldest():
+    async def scenario():
+        cache = ResultCache(max_entries=2)
+        compute = SlowCompute()
+        compute.release.set()
+        for key in ("a", "b", "c"):
+            await cache.get_or_compute(key, compute)
+        assert list(cache._entries) == ["b", "c"]
+
+    run(scenario())
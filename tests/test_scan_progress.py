@@ -0,0 +1,68 @@
+import threading
+
+from Neo4jMusicPlayer import ScanProgress
+
+
+def test_events_are_throttled_but_start_and_finish_always_published():
+    progress = ScanProgress(min_interval=60)
+    progress.start(found=3, sizes=[10, 20, 30])
+    for size in (10, 20, 30):
+        progress.file_done(size)
+    progress.finish()
+
+    events = []
+    while not progress.events.empty():
+        events.append(progress.events.get_nowait())
+    assert [e["finished"] for e in events] == [False, True]
+    assert events[-1]["done"] == 3
+    assert events[-1]["bytes_done"] == 60
+    assert events[-1]["pending"] == 0
+    assert events[-1]["eta"] == 0.0
+
+
+def test_drain_returns_latest_event_only():
+    progress = ScanProgress(min_interval=0)
+    progress.start(found=2, sizes=[1, 1])
+    progress.file_done(1)
+    progress.file_failed("/music/broken.mp3", ValueError("bad header"), 1)
+
+    event = progress.drain()
+    assert event["done"] == 2
+    assert event["errors"] == 1
+    assert event["last_error"] == "broken.mp3: bad header"
+    assert progress.drain() is None
+
+
+def test_failed_scan_is_flagged():
+    progress = ScanProgress()
+    progress.start(found=1, sizes=[5])
+    progress.finish(error=RuntimeError("connection lost"))
+
+    event = progress.drain()
+    assert event["finished"] and event["failed"]
+    assert event["last_error"] == "connection lost"
+
+
+def test_iter_events_stops_after_final_event():
+    progress = ScanProgress(min_interval=0)
+
+    def producer():
+        progress.start(found=2, sizes=[1, 1])
+        progress.file_done(1)
+        progress.file_done(1)
+        progress.finish()
+
+    worker = threading.Thread(target=producer)
+    worker.start()
+    events = list(progress.iter_events(timeout=5))
+    worker.join()
+
+    assert events[-1]["finished"]
+    assert [e["done"] for e in events] == [0, 1, 2, 2]
+
+
+def test_format_without_eta():
+    progress = ScanProgress()
+    progress.start(found=0, sizes=[])
+    text = ScanProgress.format(progress.drain())
+    assert "0 / 0" in text and "ETA ?" in text
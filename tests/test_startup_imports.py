@@ -0,0 +1,15 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_module_import_defers_heavy_libraries():
+    # V čistém procesu - testy samy mohou mít tyto moduly už načtené
+    code = ("import sys, Neo4jMusicPlayer; "
+            "print(sorted(m for m in ('asyncio', 'neo4j', 'pygame', 'mutagen', 'PIL', 'watchdog') "
+            "if m in sys.modules))")
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True,
+                            text=True, check=True).stdout
+    assert output.strip() == "[]"
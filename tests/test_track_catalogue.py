@@ -0,0 +1,62 @@
+import os
+
+from Neo4jMusicPlayer import TrackCatalogue
+
+
+def track(track_id, title, artist="Artist", genre="Rock", art=None, folder="music", duration=180):
+    return {
+        "trackId": track_id, "title": title, "duration": duration,
+        "filePath": os.path.join(folder, f"{title}.mp3"),
+        "artist": artist, "artistId": hash(artist), "genre": genre, "artHash": art,
+    }
+
+
+def test_rows_round_trip():
+    rows = [track(1, "Alpha", art="abc"), track(2, "Beta", genre=None, artist="Other")]
+    catalogue = TrackCatalogue(rows)
+    assert len(catalogue) == 2
+    assert list(catalogue) == rows
+
+
+def test_shared_values_are_interned():
+    catalogue = TrackCatalogue(track(i, f"Song {i}", art="cover") for i in range(100))
+    assert len(catalogue._artists) == 1
+    assert len(catalogue._dirs) == 1
+    assert len(catalogue._art_hashes) == 1
+
+
+def test_path_without_directory_is_kept_whole():
+    catalogue = TrackCatalogue([dict(track(1, "Alpha"), filePath="Alpha.mp3")])
+    assert catalogue.file_path(0) == "Alpha.mp3"
+    assert catalogue[0]["filePath"] == "Alpha.mp3"
+
+
+def test_view_sort_and_filter():
+    catalogue = TrackCatalogue([
+        track(1, "charlie", artist="Zed", duration=300),
+        track(2, "Alpha", artist="Beatles", duration=100),
+        track(3, "bravo", artist="Abba", duration=200),
+    ])
+    view = catalogue.view()
+    assert [t["trackId"] for t in view.sorted("title")] == [2, 3, 1]
+    assert [t["trackId"] for t in view.sorted("artist")] == [3, 2, 1]
+    assert [t["trackId"] for t in view.sorted("duration", reverse=True)] == [1, 3, 2]
+
+    # Filtr podle názvu i umělce, bez ohledu na velikost písmen
+    assert [t["trackId"] for t in view.filter("BEAT")] == [2]
+    assert [t["trackId"] for t in view.filter("a").sorted("title")] == [2, 3, 1]
+    assert view.filter("alp").display_text(0) == "Alpha - Beatles"
+
+
+def test_remove_and_move_paths():
+    rows = [track(1, "Alpha"), track(2, "Beta"), track(3, "Gamma")]
+    catalogue = TrackCatalogue(rows)
+
+    catalogue.remove_paths({rows[1]["filePath"]})
+    assert [t["trackId"] for t in catalogue] == [1, 3]
+
+    new_path = os.path.join("elsewhere", "Gamma.mp3")
+    catalogue.move_paths({rows[2]["filePath"]: new_path})
+    assert catalogue[1]["filePath"] == new_path
+    assert catalogue[1]["title"] == "Gamma"
+    assert catalogue[0]["filePath"] == rows[0]["filePath"]